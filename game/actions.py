@@ -8,6 +8,8 @@ if TYPE_CHECKING:
 import game.color
 import game.entity
 import game.exceptions
+import game.sound
+import game.tiles
 import game.engine
 
 
@@ -42,41 +44,34 @@ class Action:
 
 
 class PickupAction(Action):
-    """Pickup an item and add it to the inventory, if there is room for it."""
+    """Pickup the top item on this tile, or every item if `pick_all` is True, and add them to the inventory
+    if there is room for them."""
 
-    def __init__(self, entity: Actor, cooldown: int = 25):
+    def __init__(self, entity: Actor, cooldown: int = 25, pick_all: bool = False):
         super().__init__(entity, cooldown)
+        self.pick_all = pick_all
 
     def perform(self) -> None:
-        actor_location_x = self.entity.x
-        actor_location_y = self.entity.y
         inventory = self.entity.inventory
+        stack = self.engine.game_map.items_at(self.entity.x, self.entity.y)
+        if not stack:
+            raise game.exceptions.Impossible("There is nothing here to pick up.")
 
-        for item in self.engine.game_map.items:
-            if actor_location_x == item.x and actor_location_y == item.y:
-                if len(inventory.items) >= inventory.capacity:
-                    raise game.exceptions.Impossible("Your inventory is full.")
+        picked_up = 0
+        for item in reversed(stack if self.pick_all else stack[-1:]):
+            if len(inventory.held) >= inventory.capacity:
+                if picked_up:
+                    break
+                raise game.exceptions.Impossible("Your inventory is full.")
 
-                self.engine.game_map.entities.remove(item)
-                item.parent = self.entity.inventory
+            self.engine.game_map.remove_entity(item)
+            item.count = 1
+            inventory.add(item)
 
-                found = False
+            self.engine.message_log.add_message(f"You picked up the {item.name}!")
+            picked_up += 1
 
-                for id in inventory.items:
-                    if (id.name == item.name and item.stackable):
-                        id.count += 1
-                        found = True
-
-                if(not found):
-                    item.count = 1
-                    inventory.items.append(item)
-
-                self.engine.message_log.add_message(f"You picked up the {item.name}!")
-                
-                self.action_performed(self.cooldown)
-                return
-
-        raise game.exceptions.Impossible("There is nothing here to pick up.")
+        self.action_performed(self.cooldown)
 
 
 class ItemAction(Action):
@@ -133,7 +128,7 @@ class TakeStairsAction(Action):
         Take the stairs, if any exist at the entity's location.
         """
         if (self.entity.x, self.entity.y) == self.engine.game_map.downstairs_location:
-            self.engine.game_world.generate_floor()
+            self.engine.game_world.descend()
             self.engine.message_log.add_message("You ascend the staircase.", game.color.descend)
             self.action_performed(self.cooldown)
         else:
@@ -167,11 +162,15 @@ class ActionWithDirection(Action):
 
 
 class MeleeAction(ActionWithDirection):
+    NOISE_RADIUS = 8  # Dormant actors this close hear the fight and wake.
+
     def perform(self) -> None:
         target = self.target_actor
         if not target:
             raise game.exceptions.Impossible("Nothing to attack.")
 
+        self.engine.game_map.make_noise(self.entity.x, self.entity.y, self.NOISE_RADIUS)
+
         damage = self.entity.fighter.stats.bulk // 5 - target.fighter.stats.shielding // 10
 
         attack_desc = f"{self.entity.name.capitalize()} attacks {target.name}"
@@ -182,6 +181,7 @@ class MeleeAction(ActionWithDirection):
 
         if damage > 0:
             self.engine.message_log.add_message(f"{attack_desc} for {damage} hit points.", attack_color)
+            game.sound.queue_sfx("sword_slash")
             target.fighter.hp -= damage
         else:
             self.engine.message_log.add_message(f"{attack_desc} but does no damage.", attack_color)
@@ -196,7 +196,7 @@ class Move(ActionWithDirection):
         if not self.engine.game_map.in_bounds(dest_x, dest_y):
             # Destination is out of bounds.
             raise game.exceptions.Impossible("That way is blocked.")
-        if not self.engine.game_map.tiles["walkable"][dest_x, dest_y]:
+        if not game.tiles.tile_types["walkable"][self.engine.game_map.tiles[dest_x, dest_y]]:
             # Destination is blocked by a tile.
             raise game.exceptions.Impossible("That way is blocked.")
         if self.engine.game_map.get_blocking_entity_at_location(dest_x, dest_y):
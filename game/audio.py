@@ -1,56 +1,138 @@
 from __future__ import annotations
 
-from typing import List
+from typing import Any, Counter, Dict, List, Optional
+import collections
+import concurrent.futures
+import hashlib
+import math
+import os
+import traceback
 
+from numpy.typing import NDArray
+import numpy as np
 import soundfile  # pip install soundfile
 import tcod.sdl.audio
 
-import game.color
-import game.entity
-import game.exceptions
-import game.game_map
-import game.input_handlers
-import game.message_log
-import game.render_functions
+import game.sound
+
+CACHE_DIRECTORY = os.path.join("cache", "audio")
+
+MAX_VOICES = 8  # Sound effects which can play at the same time.
+MAX_COALESCED_GAIN = 2.0  # Loudest a group of identical sound effects can get.
+DEFAULT_SFX = "death"
+
+
+class AudioAssetLoader:
+    """Load sound files by name on a background thread.
+
+    Files are decoded and converted to the device format once, the converted
+    samples are cached on disk keyed by the source file's hash and the device
+    format, and are memory-mapped from that cache on later launches.
+    """
+
+    def __init__(self, device: tcod.sdl.audio.AudioDevice):
+        self.device = device
+        self.clips: Dict[str, NDArray[Any]] = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-loader")
+
+    def load(self, name: str, filename: str) -> None:
+        """Start loading `filename` as `name`, this returns immediately."""
+        self.executor.submit(self._load, name, filename)
+
+    def get(self, name: str) -> Optional[NDArray[Any]]:
+        """Return the named clip, or None if it has not finished loading."""
+        return self.clips.get(name)
+
+    def cache_path(self, filename: str) -> str:
+        with open(filename, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        device_format = f"{self.device.frequency}hz_{self.device.channels}ch_{np.dtype(self.device.format).name}"
+        return os.path.join(CACHE_DIRECTORY, f"{digest}_{device_format}.npy")
+
+    def _load(self, name: str, filename: str) -> None:
+        try:
+            cache_path = self.cache_path(filename)
+            try:
+                self.clips[name] = np.load(cache_path, mmap_mode="r")
+                return
+            except (OSError, ValueError):
+                pass
+
+            sound, sample_rate = soundfile.read(filename, dtype="float32")
+            clip = self.device.convert(sound, sample_rate)
+            self.clips[name] = clip
+            try:
+                os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+                np.save(cache_path, clip)
+            except OSError:
+                pass  # Not being able to cache only costs time on the next launch.
+        except Exception:
+            traceback.print_exc()  # A missing sound is skipped, not fatal.
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class VoicePool:
+    """A fixed number of mixer channels for sound effects.
+
+    When every voice is busy a new sound steals the voice of the lowest
+    priority sound closest to finishing, or is dropped if every playing sound
+    has a higher priority.
+    """
+
+    def __init__(self, mixer: tcod.sdl.audio.BasicMixer, voices: int = MAX_VOICES):
+        self.channels: List[tcod.sdl.audio.Channel] = [mixer.get_channel(("sfx", i)) for i in range(voices)]
+        self.priorities = [0] * voices
+
+    def _remaining(self, index: int) -> int:
+        queue = self.channels[index].sound_queue
+        return queue[0].shape[0] if queue else 0
+
+    def play(self, sound: NDArray[Any], volume: float, priority: int) -> Optional[tcod.sdl.audio.Channel]:
+        """Play `sound` on a free or stolen voice and return its channel, or None if it was dropped."""
+        free = [i for i, channel in enumerate(self.channels) if not channel.busy]
+        if free:
+            index = free[0]
+        else:
+            index = min(range(len(self.channels)), key=lambda i: (self.priorities[i], self._remaining(i)))
+            if self.priorities[index] > priority:
+                return None
+        self.priorities[index] = priority
+        self.channels[index].play(sound, volume=volume)
+        return self.channels[index]
 
 
 class Audio:
     def __init__(self):
         self.mixer = tcod.sdl.audio.BasicMixer(tcod.sdl.audio.open())
+        self.loader = AudioAssetLoader(self.mixer.device)
+        self.voices = VoicePool(self.mixer)
+        self.queued_sfx: Counter[str] = collections.Counter()
         self.sfxChannel = None
-        self.musicChannel = None
-        self.sample_rate = None
-        self.newSound = None
-        self.newMusic = None
-        self.music = []
-        self.sound = []
 
     def load_sounds(self) -> None:
-        self.newSound, self.sample_rate = soundfile.read("data/death.wav")
-        self.newSound = self.mixer.device.convert(self.newSound, self.sample_rate)
-        self.sound.append(self.newSound)
-
-        self.music, self.sample_rate = soundfile.read("data/scratch.wav")
-        self.music = self.mixer.device.convert(self.music, self.sample_rate)
-        self.sound.append(self.music)
+        """Start loading every sound in the background, sounds play once they are ready."""
+        for sound in game.sound.SOUNDS.values():
+            self.loader.load(sound.name, sound.file)
 
-        self.newSound, self.sample_rate = soundfile.read("data/orc.wav")
-        self.newSound = self.mixer.device.convert(self.newSound, self.sample_rate)
-        self.sound.append(self.newSound)
+    def play_sfx(self, soundName: str, volume: float = 1.0) -> None:
+        """Play a sound effect now, if a voice is available for it."""
+        sound = game.sound.SOUNDS.get(soundName) or game.sound.SOUNDS[DEFAULT_SFX]
+        clip = self.loader.get(sound.name)
+        if clip is None:
+            return  # Still loading.
+        self.sfxChannel = self.voices.play(clip, volume=sound.volume * volume, priority=sound.priority)
 
-        self.newSound, self.sample_rate = soundfile.read("data/sword_slash.wav")
-        self.newSound = self.mixer.device.convert(self.newSound, self.sample_rate)
-        self.sound.append(self.newSound)
+    def queue_sfx(self, soundName: str) -> None:
+        """Queue a sound effect to be played by the next `flush_sfx`, such as at the end of a turn."""
+        self.queued_sfx[soundName] += 1
 
+    def flush_sfx(self) -> None:
+        """Play the queued sound effects, each distinct sound uses one voice.
 
-    def play_sfx(self, soundName: str) -> None:
-        if(soundName == "orc_die"):
-            self.sfxChannel = self.mixer.play(self.sound[2])
-        elif(soundName == "sword_slash"):
-            self.sfxChannel = self.mixer.play(self.sound[3])
-        else:
-            self.sfxChannel = self.mixer.play(self.sound[0])
-
-    def play_music(self, musicName: str) -> None:
-        self.musicChannel = self.mixer.play(self.sound[1], volume=0.2, loops=-1)
-        pass
\ No newline at end of file
+        Repeats of the same sound are coalesced into one louder sound.
+        """
+        for soundName, count in self.queued_sfx.items():
+            self.play_sfx(soundName, volume=min(MAX_COALESCED_GAIN, math.sqrt(count)))
+        self.queued_sfx.clear()
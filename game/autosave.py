@@ -0,0 +1,79 @@
+"""Periodic saving which keeps the slow parts of a save off the main thread."""
+from __future__ import annotations
+
+from typing import Deque, List, Optional
+import collections
+import concurrent.futures
+import time
+import traceback
+
+import game.engine
+import game.floor_store
+import game.save_format
+
+AUTOSAVE_INTERVAL = 120.0  # Seconds between autosaves.
+
+
+class Autosaver:
+    """Save an Engine every `interval` seconds.
+
+    Only the snapshot is taken on the calling thread, compressing and writing
+    the file happens on a background worker and the file is replaced atomically.
+    """
+
+    def __init__(self, filename: str, interval: float = AUTOSAVE_INTERVAL):
+        self.filename = filename
+        self.interval = interval
+        self.last_save = time.monotonic()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+        self.pending: Optional[concurrent.futures.Future[None]] = None
+        self.stall_times: Deque[float] = collections.deque(maxlen=100)  # Main thread seconds spent per autosave.
+
+    def update(self, engine: game.engine.Engine) -> None:
+        """Start an autosave of `engine` if one is due."""
+        if not engine.player.is_alive:
+            self.wait()  # Never let a write land after a finished game is deleted.
+            return
+        if time.monotonic() - self.last_save < self.interval:
+            return
+        if self.pending is not None and not self.pending.done():
+            return  # The previous autosave is still being written.
+        self.save(engine)
+
+    def save(self, engine: game.engine.Engine) -> None:
+        """Snapshot `engine` now and write it in the background."""
+        start = time.perf_counter()
+        store = engine.game_world.floor_store
+        # Listed with the snapshot, floors paged out after it must outlive this save.
+        stale = store.stale_files() if store.directory == game.floor_store.directory_for(self.filename) else []
+        snapshot = game.save_format.snapshot(engine)
+        self.stall_times.append(time.perf_counter() - start)
+        self.last_save = time.monotonic()
+        self.pending = self.executor.submit(self._write, snapshot, store, stale)
+
+    def _write(self, snapshot: game.save_format.Snapshot, store: game.floor_store.FloorStore, stale: List[str]) -> None:
+        try:
+            game.save_format.write_atomic(snapshot, self.filename)
+        except Exception:
+            traceback.print_exc()  # The previous save is still intact, and so are the floors it refers to.
+            return
+        store.delete(stale)
+
+    def wait(self) -> None:
+        """Block until any autosave in progress has been written."""
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+
+    def close(self) -> None:
+        """Finish any autosave in progress and stop the worker."""
+        self.wait()
+        self.executor.shutdown()
+
+    def stall_report(self) -> str:
+        """Return a summary of the time autosaves have blocked the main thread."""
+        if not self.stall_times:
+            return "No autosaves."
+        stalls_ms = sorted(stall * 1000 for stall in self.stall_times)
+        mean_ms = sum(stalls_ms) / len(stalls_ms)
+        return f"Autosave main thread stall: {len(stalls_ms)} saves, mean {mean_ms:.2f} ms, max {stalls_ms[-1]:.2f} ms."
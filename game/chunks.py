@@ -0,0 +1,178 @@
+"""Two dimensional arrays stored as square chunks, so that large maps only pay for what is on them.
+
+A ChunkedArray allocates a chunk the first time something other than its fill
+value is written to it, and frees it again once a write leaves it holding
+only the fill value.  Memory use follows the parts of a map which have
+been dug out, explored or are in view, rather than the size of the map.
+
+Indexing supports what the game needs from a NumPy array:
+
+    layer[x, y]              A single value.
+    layer[x0:x1, y0:y1]      A dense copy of a window, the same size as the window.
+    layer[xs, ys]            The values at arrays of coordinates.
+
+Writes take a single position or a window.  Fields of a structured dtype are
+read from the result, `layer[window]["walkable"]` instead of
+`layer["walkable"][window]`.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+CHUNK_SIZE = 32
+
+Window = Tuple[slice, slice]
+
+
+class ChunkedArray:
+    """A 2D array of `shape` split into CHUNK_SIZE square chunks, unallocated chunks hold `fill_value`."""
+
+    def __init__(self, shape: Tuple[int, int], dtype: Any, fill_value: Any = 0):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.fill_value = np.array(fill_value, dtype=self.dtype)
+        self.chunks: Dict[Tuple[int, int], np.ndarray] = {}  # By chunk position, each in Fortran order.
+
+    @classmethod
+    def from_dense(cls, array: np.ndarray, fill_value: Any = 0) -> ChunkedArray:
+        """Return a ChunkedArray with the contents of the dense 2D `array`."""
+        chunked = cls(array.shape, array.dtype, fill_value)
+        chunked[:, :] = array
+        return chunked
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Chunks are saved as two arrays, instead of one save file section per chunk.
+        keys = sorted(self.chunks)
+        return {
+            "shape": self.shape,
+            "dtype": self.dtype,
+            "fill_value": self.fill_value.tolist(),
+            "keys": np.array(keys, dtype=np.int32).reshape(-1, 2),
+            "data": np.stack([self.chunks[key] for key in keys]) if keys else np.zeros((0,), self.dtype),
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.shape = state["shape"]
+        self.dtype = state["dtype"]
+        self.fill_value = np.array(state["fill_value"], dtype=self.dtype)
+        self.chunks = {
+            (int(cx), int(cy)): np.asfortranarray(data) for (cx, cy), data in zip(state["keys"], state["data"])
+        }
+
+    @property
+    def nbytes(self) -> int:
+        """The bytes used by the allocated chunks."""
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def extent(self) -> Optional[Window]:
+        """Return the window covering every allocated chunk, or None if there are none.
+
+        Everything outside of it holds the fill value.
+        """
+        if not self.chunks:
+            return None
+        xs = [cx for cx, _ in self.chunks]
+        ys = [cy for _, cy in self.chunks]
+        return (
+            slice(min(xs) * CHUNK_SIZE, min(self.shape[0], (max(xs) + 1) * CHUNK_SIZE)),
+            slice(min(ys) * CHUNK_SIZE, min(self.shape[1], (max(ys) + 1) * CHUNK_SIZE)),
+        )
+
+    def _new_chunk(self) -> np.ndarray:
+        return np.full((CHUNK_SIZE, CHUNK_SIZE), self.fill_value, dtype=self.dtype, order="F")
+
+    def _window(self, key: Tuple[slice, slice]) -> Tuple[int, int, int, int]:
+        x0, x1, x_step = key[0].indices(self.shape[0])
+        y0, y1, y_step = key[1].indices(self.shape[1])
+        if x_step != 1 or y_step != 1:
+            raise IndexError("ChunkedArray windows can not be strided.")
+        return x0, max(x0, x1), y0, max(y0, y1)
+
+    def _overlaps(self, x0: int, x1: int, y0: int, y1: int) -> Iterator[Tuple[Tuple[int, int], Window, Window]]:
+        """Yield each chunk touched by a window, with the part of the window and of the chunk they share."""
+        for cx in range(x0 // CHUNK_SIZE, (x1 - 1) // CHUNK_SIZE + 1):
+            left, right = max(x0, cx * CHUNK_SIZE), min(x1, (cx + 1) * CHUNK_SIZE)
+            chunk_left = cx * CHUNK_SIZE
+            for cy in range(y0 // CHUNK_SIZE, (y1 - 1) // CHUNK_SIZE + 1):
+                top, bottom = max(y0, cy * CHUNK_SIZE), min(y1, (cy + 1) * CHUNK_SIZE)
+                chunk_top = cy * CHUNK_SIZE
+                yield (
+                    (cx, cy),
+                    (slice(left - x0, right - x0), slice(top - y0, bottom - y0)),
+                    (slice(left - chunk_left, right - chunk_left), slice(top - chunk_top, bottom - chunk_top)),
+                )
+
+    def _check_position(self, x: int, y: int) -> None:
+        if not (0 <= x < self.shape[0] and 0 <= y < self.shape[1]):
+            raise IndexError(f"Position {x}, {y} is out of bounds for a ChunkedArray of shape {self.shape}.")
+
+    def __getitem__(self, key: Tuple[Any, Any]) -> Any:
+        x, y = key
+        if isinstance(x, slice) and isinstance(y, slice):
+            x0, x1, y0, y1 = self._window(key)
+            out = np.full((x1 - x0, y1 - y0), self.fill_value, dtype=self.dtype, order="F")
+            if x1 > x0 and y1 > y0:
+                for chunk_key, out_part, chunk_part in self._overlaps(x0, x1, y0, y1):
+                    chunk = self.chunks.get(chunk_key)
+                    if chunk is not None:
+                        out[out_part] = chunk[chunk_part]
+            return out
+        if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+            return self._take(*np.broadcast_arrays(np.asarray(x), np.asarray(y)))
+        self._check_position(x, y)
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            return self.fill_value[()]
+        return chunk[x % CHUNK_SIZE, y % CHUNK_SIZE]
+
+    def _take(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Return the values at the coordinate arrays `xs`, `ys`."""
+        out = np.full(xs.shape, self.fill_value, dtype=self.dtype)
+        if not xs.size:
+            return out
+        if xs.min() < 0 or ys.min() < 0 or xs.max() >= self.shape[0] or ys.max() >= self.shape[1]:
+            raise IndexError(f"Positions are out of bounds for a ChunkedArray of shape {self.shape}.")
+        cxs, cys = xs // CHUNK_SIZE, ys // CHUNK_SIZE
+        for cx, cy in {(int(cx), int(cy)) for cx, cy in zip(cxs.ravel(), cys.ravel())}:
+            chunk = self.chunks.get((cx, cy))
+            if chunk is not None:
+                inside = (cxs == cx) & (cys == cy)
+                out[inside] = chunk[xs[inside] % CHUNK_SIZE, ys[inside] % CHUNK_SIZE]
+        return out
+
+    def __setitem__(self, key: Tuple[Any, Any], value: Any) -> None:
+        x, y = key
+        if isinstance(x, slice) and isinstance(y, slice):
+            x0, x1, y0, y1 = self._window(key)
+            if x1 <= x0 or y1 <= y0:
+                return
+            values = np.broadcast_to(np.asarray(value, dtype=self.dtype), (x1 - x0, y1 - y0))
+            for chunk_key, value_part, chunk_part in self._overlaps(x0, x1, y0, y1):
+                chunk = self.chunks.get(chunk_key)
+                if chunk is None:
+                    if (values[value_part] == self.fill_value).all():
+                        continue
+                    chunk = self.chunks[chunk_key] = self._new_chunk()
+                chunk[chunk_part] = values[value_part]
+                if (chunk == self.fill_value).all():
+                    del self.chunks[chunk_key]
+            return
+        self._check_position(x, y)
+        chunk_key = x // CHUNK_SIZE, y // CHUNK_SIZE
+        chunk = self.chunks.get(chunk_key)
+        value = np.asarray(value, dtype=self.dtype)
+        if value == self.fill_value:
+            if chunk is not None:
+                chunk[x % CHUNK_SIZE, y % CHUNK_SIZE] = value
+                if (chunk == self.fill_value).all():
+                    del self.chunks[chunk_key]
+            return
+        if chunk is None:
+            chunk = self.chunks[chunk_key] = self._new_chunk()
+        chunk[x % CHUNK_SIZE, y % CHUNK_SIZE] = value
+
+    def to_dense(self) -> np.ndarray:
+        """Return the whole array as a dense NumPy array."""
+        return self[:, :]
@@ -1,57 +1,227 @@
 from __future__ import annotations
 
-from typing import List, Tuple, Optional, TYPE_CHECKING
+from typing import Any, Dict, Iterable, List, Tuple, Optional, TYPE_CHECKING
+import concurrent.futures
+import functools
+import os
 
 import numpy as np 
-import random
 import tcod
 
 import game.actions
 import game.components.base_component as base_component
+import game.profiler
+import game.tiles
 
 if TYPE_CHECKING:
     from entity import Actor
+    import game.chunks
+    import game.game_map
+
+MIN_PARALLEL_PATHS = 6  # Fewer paths than this are computed on their turn, see `game.path_benchmark`.
+PATH_MARGIN = 16  # How far a path may stray outside of the box around its start and destination.
+
+_path_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+Box = Tuple[int, int, int, int]  # Left, top, right and bottom of a window of the map, right and bottom exclusive.
+
+
+def path_box(gamemap: game.game_map.GameMap, start: Tuple[int, int], dest: Tuple[int, int]) -> Box:
+    """Return the window a path from `start` to `dest` is searched in, the box around both ends plus PATH_MARGIN."""
+    return (
+        max(0, min(start[0], dest[0]) - PATH_MARGIN),
+        max(0, min(start[1], dest[1]) - PATH_MARGIN),
+        min(gamemap.width, max(start[0], dest[0]) + PATH_MARGIN + 1),
+        min(gamemap.height, max(start[1], dest[1]) + PATH_MARGIN + 1),
+    )
+
+
+def blocked_positions(gamemap: game.game_map.GameMap, box: Optional[Box] = None) -> np.ndarray:
+    """Return an (n, 2) array with the position of each movement blocking entity on a walkable tile.
+
+    Sorted by position, so random costs drawn for them are drawn in a
+    repeatable order.  Only the entities inside `box` are included, if given.
+    """
+    positions = [
+        position
+        for position, entities in gamemap.tile_entities.items()
+        if box is None or (box[0] <= position[0] < box[2] and box[1] <= position[1] < box[3])
+        for entity in entities
+        if entity.blocks_movement
+    ]
+    positions.sort()
+    blocked = np.array(positions, dtype=np.intp).reshape(-1, 2)
+    walkable = game.tiles.tile_types["walkable"][gamemap.tiles[blocked[:, 0], blocked[:, 1]]]
+    return blocked[walkable]
+
+
+def path_cost(tiles: game.chunks.ChunkedArray, box: Box, blocked: np.ndarray, extra_costs: np.ndarray) -> np.ndarray:
+    """Return the cost array of `box`, with `extra_costs` added at the `blocked` positions.
+
+    This only reads its arguments, so it can run on any thread.
+    """
+    left, top, right, bottom = box
+    # Copy the walkable array.
+    cost = np.array(game.tiles.tile_types["walkable"][tiles[left:right, top:bottom]], dtype=np.int8)
+    # Add to the cost of a blocked position.
+    # A lower number means more enemies will crowd behind each other in
+    # hallways.  A higher number means enemies will take longer paths in
+    # order to surround the player.
+    np.add.at(cost, (blocked[:, 0] - left, blocked[:, 1] - top), extra_costs.astype(np.int8))
+    return cost
+
+
+def compute_path(
+    cost: np.ndarray, origin: Tuple[int, int], start: Tuple[int, int], dest: Tuple[int, int]
+) -> List[Tuple[int, int]]:
+    """Return the path from `start` to `dest`, not including `start`.
+
+    `cost` covers a window of the map with its top left at `origin`.
+    This only reads its arguments, and tcod releases the GIL while pathing, so it can run on any thread.
+    """
+    origin_x, origin_y = origin
+
+    # Create a graph from the cost array and pass that graph to a new pathfinder.
+    graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
+
+    pathfinder = tcod.path.Pathfinder(graph)
+
+    pathfinder.add_root((start[0] - origin_x, start[1] - origin_y))  # Start position.
+
+    # Compute the path to the destination and remove the starting point.
+    path: List[List[int]] = pathfinder.path_to((dest[0] - origin_x, dest[1] - origin_y))[1:].tolist()
+
+    # Convert from List[List[int]] to List[Tuple[int, int]] in map coordinates.
+    return [(index[0] + origin_x, index[1] + origin_y) for index in path]
+
+
+def plan_path(
+    tiles: game.chunks.ChunkedArray,
+    box: Box,
+    blocked: np.ndarray,
+    extra_costs: np.ndarray,
+    start: Tuple[int, int],
+    dest: Tuple[int, int],
+) -> List[Tuple[int, int]]:
+    """Build the cost array and compute one path, this is the part of planning done on the pool."""
+    return compute_path(path_cost(tiles, box, blocked, extra_costs), box[:2], start, dest)
+
+
+def plan_paths(actors: Iterable[Actor]) -> None:
+    """Compute the paths that `actors` will need on their turns, in parallel.
+
+    Nothing is done for fewer than MIN_PARALLEL_PATHS paths, those are
+    computed on each actor's turn as before.  Otherwise one snapshot of the
+    blocked positions is taken for the group and the random costs are drawn
+    in the order given, so the results do not depend on thread timing.  The
+    cost arrays and paths are made on the pool, or one after another on a
+    single CPU, which draws the same random costs so replays still match.
+    Each AI uses its planned path on its turn, unless the map has changed in
+    its way since.
+    """
+    global _path_executor
+    requests = []
+    for actor in actors:
+        dest = actor.ai.path_request() if actor.ai else None
+        if dest is not None:
+            requests.append((actor, dest))
+    if len(requests) < MIN_PARALLEL_PATHS:
+        return  # Not worth the overhead, these are pathed on their turn.
+    gamemap = requests[0][0].gamemap
+    blocked = blocked_positions(gamemap)
+    jobs = []
+    for actor, dest in requests:
+        box = path_box(gamemap, (actor.x, actor.y), dest)
+        inside = (
+            (box[0] <= blocked[:, 0]) & (blocked[:, 0] < box[2]) & (box[1] <= blocked[:, 1]) & (blocked[:, 1] < box[3])
+        )
+        actor_blocked = blocked[inside]
+        jobs.append((box, actor_blocked, actor.ai.draw_extra_costs(len(actor_blocked)), (actor.x, actor.y), dest))
+    plan = functools.partial(plan_path, gamemap.tiles)
+    if (os.cpu_count() or 1) == 1:
+        paths: Iterable[List[Tuple[int, int]]] = map(plan, *zip(*jobs))  # A pool only adds overhead.
+    else:
+        if _path_executor is None:
+            _path_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=os.cpu_count(), thread_name_prefix="ai-planner"
+            )
+        paths = _path_executor.map(plan, *zip(*jobs))
+    for (actor, _), path in zip(requests, paths):
+        actor.ai.planned_path = path
+
 
 class BaseAI(game.actions.Action, base_component.BaseComponent):
-    isHostile = 0 # Enemies are set to hostile when they are revealed on the map, potentially update to A* pathfinding for LOS.
+    def __init__(self, entity: Actor):
+        super().__init__(entity)
+        self._is_hostile = False
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if "_is_hostile" not in state:  # Saved when hostility was the `isHostile` flag.
+            state["_is_hostile"] = bool(state.pop("isHostile", False))
+        self.__dict__.update(state)
+
+    @property
+    def is_hostile(self) -> bool:
+        """True once this enemy has been revealed to the player, potentially update to A* pathfinding for LOS."""
+        return self._is_hostile
+
+    @is_hostile.setter
+    def is_hostile(self, value: bool) -> None:
+        """Set hostility, keeping the map's set of hostile actors up to date."""
+        self._is_hostile = value
+        if value:
+            self.entity.gamemap.hostile_actors.add(self.entity)
+        else:
+            self.entity.gamemap.hostile_actors.discard(self.entity)
+
     def perform(self) -> None:
         raise NotImplementedError()
 
+    def is_idle(self) -> bool:
+        """Return True if this AI would only wait on its turn, without changing any state but its cooldown."""
+        return False
+
+    def path_request(self) -> Optional[Tuple[int, int]]:
+        """Return where this AI will need a path to on its next turn, or None."""
+        return None
+
+    @game.profiler.timed("get_path_to")
     def get_path_to(self, dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
         """Compute and return a path to the target position.
 
         If there is no valid path then returns an empty list.
         """
-        # Copy the walkable array.
-        cost = np.array(self.entity.gamemap.tiles["walkable"], dtype=np.int8)
-
-        for entity in self.entity.gamemap.entities:
-            # Check that an enitiy blocks movement and the cost isn't zero (blocking.)
-            if entity.blocks_movement and cost[entity.x, entity.y]:
-                # Add to the cost of a blocked position.
-                # A lower number means more enemies will crowd behind each other in
-                # hallways.  A higher number means enemies will take longer paths in
-                # order to surround the player.
-                cost[entity.x, entity.y] += random.randint(8, 12)
-
-        # Create a graph from the cost array and pass that graph to a new pathfinder.
-        graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
-
-        pathfinder = tcod.path.Pathfinder(graph)
-
-        pathfinder.add_root((self.entity.x, self.entity.y))  # Start position.
+        gamemap = self.entity.gamemap
+        start, dest = (self.entity.x, self.entity.y), (dest_x, dest_y)
+        box = path_box(gamemap, start, dest)
+        blocked = blocked_positions(gamemap, box)
+        return plan_path(gamemap.tiles, box, blocked, self.draw_extra_costs(len(blocked)), start, dest)
 
-        # Compute the path to the destination and remove the starting point.
-        path: List[List[int]] = pathfinder.path_to((dest_x, dest_y))[1:].tolist()
-
-        # Convert from List[List[int]] to List[Tuple[int, int]].
-        return [(index[0], index[1]) for index in path]
+    def draw_extra_costs(self, count: int) -> np.ndarray:
+        """Draw the random extra cost of `count` blocked positions, in order."""
+        return np.array([self.engine.rng.ai.randint(8, 12) for _ in range(count)], dtype=np.int8)
 
 
 class HostileEnemy(BaseAI):
     def __init__(self, entity: Actor):
         super().__init__(entity)
         self.path: List[Tuple[int, int]] = []
+        self.planned_path: Optional[List[Tuple[int, int]]] = None  # From `plan_paths`, used on the next turn.
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        state.setdefault("planned_path", None)  # Saved before paths were planned ahead.
+        super().__setstate__(state)
+
+    def path_request(self) -> Optional[Tuple[int, int]]:
+        target = self.engine.player
+        if not self.engine.game_map.visible[self.entity.x, self.entity.y]:
+            return None
+        if max(abs(target.x - self.entity.x), abs(target.y - self.entity.y)) <= 1:
+            return None  # Will attack instead.
+        return target.x, target.y
+
+    def is_idle(self) -> bool:
+        return not self.path and not self.engine.game_map.visible[self.entity.x, self.entity.y]
 
     def perform(self) -> None:
         target = self.engine.player
@@ -60,11 +230,21 @@ class HostileEnemy(BaseAI):
         distance = max(abs(dx), abs(dy))  # Chebyshev distance.
 
         if self.engine.game_map.visible[self.entity.x, self.entity.y]:
-            self.isHostile = 1
+            if not self.is_hostile:
+                self.is_hostile = True
             if distance <= 1:
+                self.planned_path = None
                 return game.actions.MeleeAction(100, self.entity, dx, dy).perform()
 
-            self.path = self.get_path_to(target.x, target.y)
+            planned_path, self.planned_path = self.planned_path, None
+            if (
+                planned_path
+                and self.entity.distance(*planned_path[0]) < 2  # The plan starts from where this actor is.
+                and not self.engine.game_map.get_blocking_entity_at_location(*planned_path[0])
+            ):
+                self.path = planned_path
+            else:  # Nothing planned, or another actor has moved into the way since.
+                self.path = self.get_path_to(target.x, target.y)
 
         if self.path:
             dest_x, dest_y = self.path.pop(0)
@@ -86,6 +266,7 @@ class ConfusedEnemy(BaseAI):
 
     def __init__(self, entity: game.entity.Actor, previous_ai: Optional[BaseAI], turns_remaining: int):
         super().__init__(entity)
+        self._is_hostile = previous_ai.is_hostile if previous_ai else False
 
         self.previous_ai = previous_ai
         self.turns_remaining = turns_remaining
@@ -97,7 +278,7 @@ class ConfusedEnemy(BaseAI):
             self.entity.ai = self.previous_ai
         else:
             # Pick a random direction
-            direction_x, direction_y = random.choice(
+            direction_x, direction_y = self.engine.rng.ai.choice(
                 [
                     (-1, -1),  # Northwest
                     (0, -1),  # North
@@ -119,3 +300,4 @@ class ConfusedEnemy(BaseAI):
                 direction_x,
                 direction_y,
             ).perform()
+
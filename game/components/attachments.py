@@ -11,6 +11,7 @@ import game.entity
 
 class Attachments(game.components.base_component.BaseComponent):
     parent: game.entity.Actor
+    version = 0  # Increased whenever something is attached or detached.
 
     def __init__(self):
         self.chassis_socket = game.components.attachable.Socket(game.attachment_types.AttachmentType.CHASSIS)
@@ -32,6 +33,7 @@ class Attachments(game.components.base_component.BaseComponent):
 
 
     def attach(self, attachment: game.entity.Item, socket_index = -1) -> None:
+        self.version += 1
         if socket_index == -1:
             sockets = self.get_sockets()
             for socket in sockets:
@@ -50,6 +52,11 @@ class Attachments(game.components.base_component.BaseComponent):
             for effect in self.get_all_attachment_effects():
                 self.parent.effect_handler.add_effect(effect)
 
+    def detach(self, socket_index: int) -> Optional[game.entity.Item]:
+        """Detach and return the attachment in the socket at `socket_index`, along with everything attached to it."""
+        self.version += 1
+        return self.get_sockets()[socket_index].detach()
+
     def get_all_attachment_effects(self) -> list[game.components.effect.Effect]:
         return self.chassis_socket.get_all_effects()
 
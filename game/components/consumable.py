@@ -34,9 +34,7 @@ class Consumable(base_component.BaseComponent):
         entity = self.parent
         inventory = entity.parent
         if isinstance(inventory, game.components.inventory.Inventory):
-            entity.count -= 1
-            if (entity.count <= 0):
-                inventory.items.remove(entity)
+            inventory.take_one(entity)
 
 class ConfusionConsumable(Consumable):
     def __init__(self, consume_time, number_of_turns: int):
@@ -94,16 +92,14 @@ class FireballDamageConsumable(Consumable):
         if not self.engine.game_map.visible[target_xy]:
             raise game.exceptions.Impossible("You cannot target an area that you cannot see.")
 
-        targets_hit = False
-        for actor in self.engine.game_map.actors:
-            if actor.distance(*target_xy) <= self.radius:
-                self.engine.message_log.add_message(
-                    f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
-                )
-                actor.fighter.take_damage(self.damage)
-                targets_hit = True
+        targets = self.engine.game_map.actors_in_radius(*target_xy, self.radius)
+        for actor in targets:
+            self.engine.message_log.add_message(
+                f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
+            )
+            actor.fighter.take_damage(self.damage)
 
-        if not targets_hit:
+        if not targets:
             raise game.exceptions.Impossible("There are no targets in the radius.")
         self.consume()
         return self.consume_time
@@ -137,16 +133,9 @@ class LightningDamageConsumable(Consumable):
 
     def activate(self, action: game.actions.ItemAction) -> int:
         consumer = action.entity
-        target = None
-        closest_distance = self.maximum_range + 1.0
-
-        for actor in self.engine.game_map.actors:
-            if actor is not consumer and self.parent.gamemap.visible[actor.x, actor.y]:
-                distance = consumer.distance(actor.x, actor.y)
-
-                if distance < closest_distance:
-                    target = actor
-                    closest_distance = distance
+        target = self.engine.game_map.nearest_visible_actor(
+            consumer.x, consumer.y, self.maximum_range + 1.0, exclude=consumer
+        )
 
         if target:
             self.engine.message_log.add_message(
@@ -7,6 +7,7 @@ if TYPE_CHECKING:
 
 import game.actions
 import game.exceptions
+import game.profiler
 import game.stat_types
 import game.components.effect as effect
 import game.components.base_component as base_component
@@ -40,6 +41,7 @@ class EffectHandler(base_component.BaseComponent):
                 self.effects[effect_index].stacks -= stacks
 
 
+    @game.profiler.timed("activate_all")
     def activate_all(self, action: Optional[game.actions.Action] = None) -> None:
         stat_changes: dict[game.stat_types.StatType, int] = {}
         to_remove = []
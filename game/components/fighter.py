@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from typing import List
 import copy
 
 import game.components.base_component as base_component
@@ -8,6 +9,7 @@ import game.color
 import game.entity
 import game.input_handlers
 import game.render_order
+import game.sound
 import game.stat_types
 
 
@@ -53,22 +55,50 @@ class Fighter(base_component.BaseComponent):
             self.die()
 
     def die(self) -> None:
-        if self.engine.player is self.parent:
+        actor = self.parent
+        gamemap = actor.gamemap
+        if self.engine.player is actor:
             death_message = "You died!"
             death_message_color = game.color.player_die
+            game.sound.queue_sfx("death")
         else:
-            death_message = f"{self.parent.name} is dead!"
+            death_message = f"{actor.name} is dead!"
             death_message_color = game.color.enemy_die
-
-        self.parent.char = "%"
-        self.parent.color = (191, 0, 0)
-        self.parent.blocks_movement = False
-        self.parent.ai = None
-        self.parent.name = f"remains of {self.parent.name}"
-        self.parent.render_order = game.render_order.RenderOrder.CORPSE
+            game.sound.queue_sfx("orc_die")
+
+        actor.ai = None
+        gamemap.awake_actors.discard(actor)
+        gamemap.dormant.discard(actor)
+        gamemap.hostile_actors.discard(actor)
+
+        if self.engine.player is actor:
+            # The player stays an Actor, the game over screen still shows them.
+            actor.char = "%"
+            actor.color = (191, 0, 0)
+            actor.blocks_movement = False
+            actor.name = f"remains of {actor.name}"
+            actor.render_order = game.render_order.RenderOrder.CORPSE
+        else:
+            # Everything else is replaced by a Corpse, only the parts worth salvaging are left as items.
+            for item in self.salvage():
+                item.place(actor.x, actor.y, gamemap)
+            gamemap.remove_entity(actor)
+            game.entity.Corpse(x=actor.x, y=actor.y, name=f"remains of {actor.name}").place(actor.x, actor.y, gamemap)
 
         self.engine.message_log.add_message(death_message, death_message_color)
 
+    def salvage(self) -> List[game.entity.Item]:
+        """Take apart this fighter's attachments and inventory, and return them as separate items."""
+        parts = [socket.attachment for socket in self.parent.attachments.get_sockets() if socket.attachment]
+        for part in parts:
+            for socket in part.attachable.sockets:
+                socket.detach()
+        self.parent.attachments.chassis_socket.detach()
+        items = list(self.parent.inventory.items)
+        for item in items:
+            self.parent.inventory.remove(item)
+        return parts + items
+
     def heal(self, amount: int) -> int:
         if self.hp == self.max_hp:
             return 0
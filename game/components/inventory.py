@@ -1,27 +1,127 @@
 from __future__ import annotations
 
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
+import game.attachment_types
 import game.components.base_component as base_component
 import game.entity
 
+_INDEXES = ("stacks", "consumables", "equippables", "attachables")
+
 
 class Inventory(base_component.BaseComponent):
+    """Items held by an actor, indexed by name and category.
+
+    `held` is a dict used as an ordered set, so removing an item does not
+    search the inventory.  `items` is a tuple of it in the order items were
+    added, as listed in menus and indexed by replays.  Change the contents with
+    `add`, `remove` and `take_one` only, so that the indexes stay correct and
+    `version` counts every change.
+    """
+
     parent: game.entity.Actor
+    version = 0  # Increased on every change, menus rebuild their rows when it changes.
+    _view: Tuple[game.entity.Item, ...] = ()
+    _view_version = -1  # The version `_view` was built at.
 
     def __init__(self, capacity: int):
         self.capacity = capacity
-        self.items: List[game.entity.Item] = []
+        self.held: Dict[game.entity.Item, None] = {}
+        self._reindex()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop("_view", None)
+        state.pop("_view_version", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if "held" not in state:  # Saved when items were kept in a list.
+            state["held"] = dict.fromkeys(state.pop("items"))
+        self.__dict__.update(state)
+
+    @property
+    def items(self) -> Tuple[game.entity.Item, ...]:
+        """The held items in the order they were added, rebuilt only after the contents change."""
+        if self._view_version != self.version:
+            self._view = tuple(self.held)
+            self._view_version = self.version
+        return self._view
+
+    def _reindex(self) -> None:
+        """Build the indexes from `held`."""
+        self.stacks: Dict[str, game.entity.Item] = {}  # Stackable items by name.
+        # The buckets are dicts used as ordered sets, so they keep the order of `held`.
+        self.consumables: Dict[game.entity.Item, None] = {}
+        self.equippables: Dict[game.entity.Item, None] = {}
+        self.attachables: Dict[game.attachment_types.AttachmentType, Dict[game.entity.Item, None]] = {}
+        for item in self.held:
+            self._index(item)
+
+    def _index(self, item: game.entity.Item) -> None:
+        if item.stackable:
+            self.stacks.setdefault(item.name, item)
+        if item.consumable:
+            self.consumables[item] = None
+        if item.equippable:
+            self.equippables[item] = None
+        if item.attachable:
+            self.attachables.setdefault(item.attachable.type, {})[item] = None
+
+    def __getattr__(self, name: str) -> Any:
+        """Build the indexes of inventories from saves made before they existed, on first use."""
+        if name not in _INDEXES or "held" not in self.__dict__:
+            raise AttributeError(name)
+        self._reindex()
+        return self.__dict__[name]
+
+    def get_stack(self, name: str) -> Optional[game.entity.Item]:
+        """Return the stack of stackable items called `name`, or None."""
+        return self.stacks.get(name)
+
+    def attachables_of_type(self, attachment_type: game.attachment_types.AttachmentType) -> List[game.entity.Item]:
+        """Return the items which fit a socket of `attachment_type`."""
+        return list(self.attachables.get(attachment_type, ()))
+
+    def add(self, item: game.entity.Item) -> game.entity.Item:
+        """Add an item, merging it into the stack of the same name if it is stackable.
+
+        Returns the item which now holds it in this inventory.
+        """
+        self.version += 1
+        stack = self.stacks.get(item.name) if item.stackable else None
+        if stack is not None:
+            stack.count += item.count
+            return stack
+        item.parent = self
+        self.held[item] = None
+        self._index(item)
+        return item
+
+    def remove(self, item: game.entity.Item) -> None:
+        """Remove an item along with its whole stack."""
+        self.version += 1
+        del self.held[item]
+        if self.stacks.get(item.name) is item:
+            del self.stacks[item.name]
+        self.consumables.pop(item, None)
+        self.equippables.pop(item, None)
+        if item.attachable:
+            self.attachables.get(item.attachable.type, {}).pop(item, None)
+
+    def take_one(self, item: game.entity.Item) -> None:
+        """Take one item off of a stack, removing the stack once it is empty."""
+        self.version += 1
+        item.count -= 1
+        if item.count <= 0:
+            self.remove(item)
 
     def drop(self, item: game.entity.Item) -> None:
         """
         Removes an item from the inventory and restores it to the game map, at the player's current location.
         """
 
-        item.count -= 1
+        self.take_one(item)
         item.spawn(self.gamemap, self.parent.x, self.parent.y)
 
-        if (item.count <= 0):
-            self.items.remove(item)
-
         self.engine.message_log.add_message(f"You dropped the {item.name}.")
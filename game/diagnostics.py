@@ -0,0 +1,217 @@
+"""Memory accounting for a running game, by floor, entity prototype, component, array and message log.
+
+Sizes come from walking the object graph with `sys.getsizeof`, so they are
+approximate: objects shared between entities such as interned strings are
+counted by each of them, and allocator overhead is not counted at all.  Use
+`--tracemalloc` for the total actually allocated while a save loads.
+
+Run with `python -m game.diagnostics savegame.sav`, or `--new SEED` to look
+at a freshly generated game.  Add `--map-size 1000x1000` to generate the new
+game's floors at that size, this is the way to measure large floors.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import argparse
+import collections
+import enum
+import gc
+import io
+import os
+import sys
+import tempfile
+import tracemalloc
+import types
+
+import numpy as np
+
+import game.engine
+import game.chunks
+import game.components.base_component
+import game.entity
+import game.game_map
+import game.save_format
+
+FLOOR_MEMORY_BUDGET = 4 * 1024 * 1024  # Bytes, floors larger than this are reported with a warning.
+
+# The walk never enters these, they are shared by everything or are not game state.
+_SKIPPED_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    types.CodeType,
+    enum.Enum,
+)
+# The walk only enters these if they are what is being measured, an entity's size doesn't include its floor.
+_BOUNDARY_TYPES = (game.engine.Engine, game.game_map.GameWorld, game.game_map.GameMap)
+
+
+def deep_size(obj: Any, exclude: Iterable[Any] = ()) -> int:
+    """Return the approximate bytes used by `obj` and everything it references, except for `exclude`."""
+    seen = {id(other) for other in exclude}
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        if isinstance(current, _SKIPPED_TYPES):
+            continue
+        if current is not obj and isinstance(current, _BOUNDARY_TYPES):
+            continue
+        total += sys.getsizeof(current)
+        if isinstance(current, np.ndarray):
+            continue  # getsizeof already counts the data an array owns.
+        stack.extend(gc.get_referents(current))
+    return total
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def components(entity: game.entity.Entity) -> Iterator[game.components.base_component.BaseComponent]:
+    """Yield the components attached to `entity`."""
+    for value in vars(entity).values():
+        if isinstance(value, game.components.base_component.BaseComponent):
+            yield value
+
+
+def arrays(game_map: game.game_map.GameMap) -> Iterator[Tuple[str, Union[np.ndarray, game.chunks.ChunkedArray]]]:
+    """Yield the name and value of each NumPy or chunked array held by `game_map`."""
+    for name, value in vars(game_map).items():
+        if isinstance(value, (np.ndarray, game.chunks.ChunkedArray)):
+            yield name, value
+
+
+class MemoryReport:
+    """Sizes measured from one Engine, see `lines` for the report."""
+
+    def __init__(self, engine: game.engine.Engine, budget: int = FLOOR_MEMORY_BUDGET):
+        self.engine = engine
+        self.budget = budget
+        self.floors: Dict[int, int] = {}  # Resident floor number to bytes.
+        self.prototypes: Dict[str, List[int]] = collections.defaultdict(list)  # Entity name to the size of each.
+        self.component_types: Dict[str, List[int]] = collections.defaultdict(list)
+        self.arrays: List[Tuple[str, Tuple[int, ...], int]] = []  # Description, shape, bytes.
+
+        for floor, game_map in sorted(engine.game_world.floors.items()):
+            self.floors[floor] = deep_size(game_map)
+            for name, array in arrays(game_map):
+                self.arrays.append((f"floor {floor} {name}", array.shape, array.nbytes))
+            for entity in game_map.entities:
+                self.prototypes[entity.name].append(deep_size(entity, exclude=[game_map]))
+                for component in components(entity):
+                    self.component_types[type(component).__name__].append(
+                        deep_size(component, exclude=[entity, game_map])
+                    )
+        self.message_log = deep_size(engine.message_log)
+
+    def over_budget(self) -> List[int]:
+        """Return the resident floors which use more than the budget."""
+        return [floor for floor, size in self.floors.items() if size > self.budget]
+
+    def lines(self) -> Iterator[str]:
+        engine = self.engine
+        yield "Resident floors:"
+        for floor, size in self.floors.items():
+            current = " (current)" if floor == engine.game_world.current_floor else ""
+            entities = len(engine.game_world.floors[floor].entities)
+            yield f"  floor {floor:<3} {format_bytes(size):>11}  {entities} entities{current}"
+            if size > self.budget:
+                yield f"  WARNING: floor {floor} is over the budget of {format_bytes(self.budget)}."
+        store = engine.game_world.floor_store
+        paged = [floor for floor in store.floors() if floor not in self.floors]
+        if paged:
+            on_disk = sum(os.path.getsize(store.path(floor)) for floor in paged)
+            yield f"  {len(paged)} floors paged out, {format_bytes(on_disk)} on disk."
+
+        yield ""
+        yield from self._table("Entities by prototype:", self.prototypes)
+        yield ""
+        yield from self._table("Components by type:", self.component_types)
+
+        yield ""
+        yield "Arrays, allocated bytes:"
+        for name, shape, size in self.arrays:
+            yield f"  {name:<24} {str(shape):>12} {format_bytes(size):>11}"
+
+        yield ""
+        yield f"Message log: {len(engine.message_log.messages)} messages, {format_bytes(self.message_log)}"
+        yield f"Save file: {format_bytes(save_size(engine))}"
+
+    @staticmethod
+    def _table(title: str, sizes: Dict[str, List[int]]) -> Iterator[str]:
+        yield f"{title:<26}{'count':>7}{'total':>12}{'mean':>12}"
+        for name, samples in sorted(sizes.items(), key=lambda item: sum(item[1]), reverse=True):
+            total = sum(samples)
+            yield f"  {name[:24]:<24}{len(samples):>7}{format_bytes(total):>12}{format_bytes(total / len(samples)):>12}"
+
+
+def save_size(engine: game.engine.Engine) -> int:
+    """Return the size in bytes of a save of `engine`."""
+    buffer = io.BytesIO()
+    game.save_format.dump(engine, buffer)
+    return len(buffer.getvalue())
+
+
+def traced_load(filename: str) -> Tuple[game.engine.Engine, int]:
+    """Load a save and return it with the bytes still allocated from loading it, measured by tracemalloc."""
+    import game.setup_game
+
+    tracemalloc.start()
+    try:
+        engine = game.setup_game.load_game(filename)
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return engine, allocated
+
+
+def map_size(text: str) -> Tuple[int, int]:
+    """Parse a floor size written as WIDTHxHEIGHT."""
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not a size like 1000x1000.")
+    if width < 20 or height < 20:
+        raise argparse.ArgumentTypeError("Floors must be at least 20x20.")
+    return width, height
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import game.setup_game
+
+    parser = argparse.ArgumentParser(description="Report how much memory a game uses.")
+    parser.add_argument("save", nargs="?", default="savegame.sav")
+    parser.add_argument("--new", type=int, metavar="SEED", help="Measure a new game instead of a save.")
+    parser.add_argument(
+        "--map-size", type=map_size, default=game.setup_game.MAP_SIZE, metavar="WxH", help="Floor size for --new."
+    )
+    parser.add_argument("--tracemalloc", action="store_true", help="Also measure the memory allocated by loading.")
+    parser.add_argument("--budget", type=int, default=FLOOR_MEMORY_BUDGET, help="Floor budget in bytes.")
+    args = parser.parse_args(argv)
+
+    if args.new is not None:
+        engine = game.setup_game.new_game(floor_directory=tempfile.mkdtemp(), seed=args.new, map_size=args.map_size)
+    elif args.tracemalloc:
+        engine, allocated = traced_load(args.save)
+        print(f"Loading {args.save} allocated {format_bytes(allocated)}.\n")
+    else:
+        engine = game.setup_game.load_game(args.save)
+    report = MemoryReport(engine, args.budget)
+    for line in report.lines():
+        print(line)
+    if args.new is not None:
+        engine.game_world.floor_store.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,180 @@
 from __future__ import annotations
 
-import lzma
-import dill as pickle
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
 
 import tcod
 
+if TYPE_CHECKING:
+    import game.actions
+    import game.components.ai
+
 import game.color
 import game.entity
 import game.exceptions
+import game.floor_store
 import game.game_map
 import game.input_handlers
 import game.message_log
+import game.profiler
+import game.rng
 import game.render_functions
+import game.save_format
+import game.sound
+import game.tiles
+
+
+FOV_RADIUS = 8
 
 
 class Engine:
     game_map: game.game_map.GameMap
     game_world: game.game_map.GameWorld
 
-    def __init__(self, player: game.entity.Actor):
+    def __init__(self, player: game.entity.Actor, seed: int):
         self.message_log = game.message_log.MessageLog()
         self.mouse_location = (0, 0)
         self.player = player
+        self.rng = game.rng.RandomStreams(seed)  # Saved with the game, so a loaded game continues the same streams.
         
     def lower_cooldowns(self, amount: int):
-        for entity in self.game_map.actors:
+        for entity in self.game_map.active_actors:
             entity.cooldown -= amount
         self.player.cooldown -= amount
 
-    def get_next_actor_group(self) -> game.entity.Actor:
-        all_actors = sorted(set(self.game_map.actors), key=lambda Actor: Actor.cooldown)
+    def get_next_actor_group(self) -> Tuple[List[game.entity.Actor], int]:
+        all_actors = sorted(set(self.game_map.active_actors), key=lambda Actor: Actor.cooldown)
         lowest_cooldown = all_actors[0].cooldown
-        return  (set(actor for actor in all_actors if actor.cooldown == lowest_cooldown and actor.is_alive), lowest_cooldown)
+        # Ordered by position rather than left as a set, sets of entities iterate in memory order and the group's
+        # turns and their random draws must happen in the same order on every run for replays to match.
+        group = [actor for actor in all_actors if actor.cooldown == lowest_cooldown and actor.is_alive]
+        return sorted(group, key=lambda actor: (actor.x, actor.y)), lowest_cooldown
 
 
-    def review_hostile_enemies(self) -> None:
-        for entity in set(self.game_map.actors) - {self.player}:
-            if entity.ai.isHostile:
-                return True
-        return False
+    def review_hostile_enemies(self) -> bool:
+        """Return True if any enemy on this floor is hostile."""
+        return bool(self.game_map.hostile_actors)
           
 
     def handle_enemy_turns(self) -> None: 
-        next_group: set[game.entity.Actor]
+        next_group: List[game.entity.Actor]
         next_cooldown: int
         next_group, next_cooldown = self.get_next_actor_group()
-        while not (self.player in next_group):
+        while self.player.is_alive and not (self.player in next_group):
+            with game.profiler.profiler.timer("AI planning"):
+                game.components.ai.plan_paths(next_group)
             for actor in next_group:
                 if actor.ai:
                     try:
-                        actor.ai.perform()
+                        with game.profiler.profiler.timer("AI", actor.name):
+                            actor.ai.perform()
                     except game.exceptions.Impossible:
                         #TODO: Find a more graceful solution to enemies trying to do the impossible
                         actor.cooldown = 100
+                    if self.game_map.should_sleep(actor):
+                        self.game_map.sleep(actor)
             self.lower_cooldowns(next_cooldown)
             next_group, next_cooldown = self.get_next_actor_group()
 
         self.lower_cooldowns(self.player.cooldown)
-
+        game.sound.flush_sfx()
+
+    def rest_turn(self) -> None:
+        """Spend one player turn waiting and let every other actor take its turns."""
+        game.actions.WaitAction(self.player).perform()
+        self.handle_enemy_turns()
+
+    def can_fast_forward(self) -> bool:
+        """Return True if no actor other than the player would do anything but wait."""
+        return all(actor.ai.is_idle() for actor in self.game_map.active_actors if actor is not self.player)
+
+    def _simulate_rest_turn(
+        self, cooldowns: Dict[game.entity.Actor, int], sleepers: Set[game.entity.Actor]
+    ) -> None:
+        """Apply `rest_turn` to `cooldowns` as if every other actor only waits.
+
+        This mirrors the scheduling arithmetic of `handle_enemy_turns` and
+        `lower_cooldowns`.  Actors in `sleepers` go dormant after their first
+        turn, they are removed from `cooldowns` and keep the cooldown of 100
+        their wait left them with.
+        """
+        player = self.player
+        cooldowns[player] = 100
+        while True:
+            lowest = min(cooldowns.values())
+            group = [actor for actor, cooldown in cooldowns.items() if cooldown == lowest]
+            if player in group:
+                break
+            for actor in group:
+                cooldowns[actor] = 100  # WaitAction.
+                if actor in sleepers:
+                    del cooldowns[actor]
+            for actor in cooldowns:
+                cooldowns[actor] -= lowest
+            cooldowns[player] -= lowest
+        player_cooldown = cooldowns[player]
+        for actor in cooldowns:
+            cooldowns[actor] -= player_cooldown
+        cooldowns[player] -= player_cooldown
+
+    def fast_forward_rest(self, turns: int) -> None:
+        """Have the player rest for `turns` turns, ending in the same state as calling `rest_turn` that many times.
+
+        Only valid while `can_fast_forward` is True.  The cooldowns are simulated
+        without running any AI until they repeat, then whole cycles are skipped.
+        Actor effects are activated once, as repeated activations of the same
+        stat effects give the same result.
+        """
+        if turns <= 0:
+            return
+        game_map = self.game_map
+        actors: List[game.entity.Actor] = sorted(game_map.active_actors, key=lambda actor: (actor.x, actor.y))
+        cooldowns = {actor: actor.cooldown for actor in actors}
+        # Nothing moves while resting, so the actors which go dormant after their next turn are known up front.
+        sleepers = {actor for actor in actors if game_map.should_sleep(actor)}
+        seen: Dict[Tuple[Optional[int], ...], int] = {}
+        states: List[Tuple[Optional[int], ...]] = []
+        for turn in range(turns):
+            self._simulate_rest_turn(cooldowns, sleepers)
+            state = tuple(cooldowns.get(actor) for actor in actors)  # None once an actor is dormant.
+            if state in seen:
+                cycle_start = seen[state]
+                period = turn - cycle_start
+                state = states[cycle_start + (turns - 1 - cycle_start) % period]
+                break
+            seen[state] = turn
+            states.append(state)
+
+        for actor, cooldown in zip(actors, state):
+            if cooldown is None:
+                actor.cooldown = 100
+                game_map.sleep(actor)
+            else:
+                actor.cooldown = cooldown
+            actor.effect_handler.activate_all(game.actions.WaitAction(actor))
+
+    @game.profiler.timed("update_fov")
     def update_fov(self) -> None:
-        """Recompute the visible area based on the players point of view."""
-        self.game_map.visible[:] = tcod.map.compute_fov(
-            self.game_map.tiles["transparent"],
-            (self.player.x, self.player.y),
-            radius=8,
+        """Recompute the visible area based on the players point of view.
+
+        Only the window within FOV_RADIUS of the player is computed, so the cost does not depend on the map size.
+        """
+        game_map = self.game_map
+        x, y = self.player.x, self.player.y
+        left, top = max(0, x - FOV_RADIUS), max(0, y - FOV_RADIUS)
+        window = (
+            slice(left, min(game_map.width, x + FOV_RADIUS + 1)),
+            slice(top, min(game_map.height, y + FOV_RADIUS + 1)),
+        )
+        game_map.visible[game_map.visible_window] = False
+        game_map.visible[window] = tcod.map.compute_fov(
+            game.tiles.tile_types["transparent"][game_map.tiles[window]],
+            (x - left, y - top),
+            radius=FOV_RADIUS,
         )
+        game_map.visible_window = window
         # If a tile is "visible" it should be added to "explored".
-        self.game_map.explored |= self.game_map.visible
+        game_map.explored[window] |= game_map.visible[window]
+        self.game_map.wake_visible()
 
     def render(self, console: tcod.console.Console) -> None:
         game.render_functions.render_flat(console=console, colorFull=game.color.dark_brown)
@@ -97,8 +205,16 @@ class Engine:
 
         game.render_functions.render_names_at_mouse_location(console=console, x=21, y=44, engine=self)
 
+        if game.profiler.profiler.enabled:
+            game.profiler.profiler.end_frame()
+            game.profiler.profiler.render(console, self)
+
     def save_as(self, filename: str) -> None:
-        """Save this Engine instance as a compressed file."""
-        save_data = lzma.compress(pickle.dumps(self))
-        with open(filename, "wb") as f:
-            f.write(save_data)
+        """Save this Engine instance to a file, see `game.save_format`.
+
+        Floor files which the save replaces are deleted once it is written, if the floors belong to `filename`.
+        """
+        store = self.game_world.floor_store
+        stale = store.stale_files() if store.directory == game.floor_store.directory_for(filename) else []
+        game.save_format.write_atomic(game.save_format.snapshot(self), filename)
+        store.delete(stale)
@@ -50,7 +50,7 @@ class Entity:
         if parent:
             # If parent isn't provided now then it will be set later.
             self.parent = parent
-            parent.entities.add(self)
+            parent.add_entity(self)
 
         self.effect_handler = game.components.effect_handler.EffectHandler()
 
@@ -64,19 +64,21 @@ class Entity:
         clone.x = x
         clone.y = y
         clone.parent = gamemap
-        gamemap.entities.add(clone)
+        gamemap.add_entity(clone)
         return clone
 
     def place(self, x: int, y: int, gamemap: Optional[game.game_map.GameMap] = None) -> None:
         """Place this entitiy at a new location.  Handles moving across GameMaps."""
+        if hasattr(self, "parent"):  # Possibly uninitialized.
+            if self.parent is self.gamemap:
+                # Taken off of the map while it moves, so that the map's index of positions stays correct.
+                gamemap = gamemap or self.gamemap
+                self.gamemap.remove_entity(self)
         self.x = x
         self.y = y
         if gamemap:
-            if hasattr(self, "parent"):  # Possibly uninitialized.
-                if self.parent is self.gamemap:
-                    self.gamemap.entities.remove(self)
             self.parent = gamemap
-            gamemap.entities.add(self)
+            gamemap.add_entity(self)
 
     def distance(self, x: int, y: int) -> float:
         """
@@ -86,8 +88,7 @@ class Entity:
 
     def move(self, dx: int, dy: int) -> None:
         # Move the entity by a given amount
-        self.x += dx
-        self.y += dy
+        self.place(self.x + dx, self.y + dy)
 
 
 class Actor(Entity):
@@ -137,6 +138,33 @@ class Actor(Entity):
         return bool(self.ai)
 
 
+class Corpse(Entity):
+    """The remains of a dead actor.
+
+    Unlike the actor it replaces this only keeps what is needed to draw and
+    describe it, so corpses are cheap to keep, scan and save.
+    """
+
+    blocks_movement = False
+    render_order = game.render_order.RenderOrder.CORPSE
+
+    def __init__(
+        self,
+        *,
+        x: int = 0,
+        y: int = 0,
+        char: str = "%",
+        color: Tuple[int, int, int] = (191, 0, 0),
+        name: str = "<Unnamed>",
+    ):
+        # Entity.__init__ is not called, a corpse has no effects.
+        self.x = x
+        self.y = y
+        self.char = char
+        self.color = color
+        self.name = name
+
+
 class Item(Entity):
     def __init__(
         self,
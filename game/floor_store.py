@@ -0,0 +1,103 @@
+"""On-disk storage for the floors of a GameWorld which are not currently in memory."""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List
+import os
+import re
+import secrets
+import shutil
+
+import game.engine
+import game.game_map
+import game.save_format
+
+FLOOR_FILE = re.compile(r"floor_(\d+)(?:_[0-9a-f]+)?\.sav")
+
+
+def directory_for(save_filename: str) -> str:
+    """Return the floor directory which belongs to the save file `save_filename`."""
+    return f"{os.path.splitext(save_filename)[0]}.floors"
+
+
+class FloorStore:
+    """Keep GameMaps in a directory, one save format file per floor.
+
+    Every time a floor is paged out it goes to a new file, an existing file is
+    never overwritten.  The store is saved with its GameWorld and remembers
+    which file holds each floor, so a save always refers to the floor files
+    written before it, even if the game kept running and paged the same
+    floors out again afterwards.  Files no save refers to any more are
+    deleted once a newer save has been written, see `stale_files`.
+
+    The Engine and player are stored as references and are reattached when a
+    floor is loaded back.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files: Dict[int, str] = {}  # The file name holding each stored floor.
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if "files" not in state:  # Saved when each floor had one fixed file name.
+            directory = state["directory"]
+            names = os.listdir(directory) if os.path.isdir(directory) else []
+            matches = (re.fullmatch(r"floor_(\d+)\.sav", name) for name in names)
+            state["files"] = {int(match[1]): match[0] for match in matches if match}
+        self.__dict__.update(state)
+
+    def path(self, floor: int) -> str:
+        return os.path.join(self.directory, self.files[floor])
+
+    def __contains__(self, floor: int) -> bool:
+        return floor in self.files
+
+    def floors(self) -> List[int]:
+        """Return the numbers of the stored floors."""
+        return sorted(self.files)
+
+    @staticmethod
+    def _external(engine: game.engine.Engine) -> Dict[str, Any]:
+        return {"engine": engine, "player": engine.player}
+
+    def save(self, floor: int, game_map: game.game_map.GameMap) -> None:
+        """Write `game_map` to the store as `floor`."""
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot = game.save_format.snapshot(game_map, external=self._external(game_map.engine))
+        name = f"floor_{floor:03d}_{secrets.token_hex(4)}.sav"
+        game.save_format.write_atomic(snapshot, os.path.join(self.directory, name))
+        self.files[floor] = name
+
+    def load(self, floor: int, engine: game.engine.Engine) -> game.game_map.GameMap:
+        """Load `floor` from the store, reattached to `engine`.
+
+        The file is left in place so that an older save of the Engine can still find it.
+        """
+        with open(self.path(floor), "rb") as f:
+            game_map = game.save_format.load(f, external=self._external(engine))
+        assert isinstance(game_map, game.game_map.GameMap)
+        return game_map
+
+    def stale_files(self) -> List[str]:
+        """Return the floor files in the directory which this store does not refer to.
+
+        Call this when taking the snapshot of a save which belongs to this
+        directory, and `delete` the files once that save is written.  They are
+        either older copies of floors or floors of the game the save replaced.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        current = set(self.files.values())
+        return [name for name in os.listdir(self.directory) if FLOOR_FILE.fullmatch(name) and name not in current]
+
+    def delete(self, names: Iterable[str]) -> None:
+        """Delete the floor files `names` from the directory."""
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        """Delete the directory and every floor in it."""
+        self.files.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,89 @@
+"""Event sources for the main loop, and input latency measurement."""
+from __future__ import annotations
+
+from typing import Deque, Iterator, List, Tuple
+import collections
+import time
+
+import tcod
+
+FRAME_BUDGET = 1 / 120  # Seconds of event handling allowed before the next frame is drawn.
+
+
+class FramePacer:
+    """Feed events to the main loop, the loop renders once after each batch.
+
+    In "blocking" mode every event from one wait is handled before rendering,
+    like the original loop.  In "paced" mode pending events are drained
+    without blocking, redundant mouse motion and held-key repeats are
+    coalesced, and handling stops once FRAME_BUDGET is spent so that a frame is
+    presented while the rest wait for the next frame.  The loop only blocks
+    when nothing is pending, so an idle game still uses no CPU.
+
+    Both modes record the time from a key press arriving to the frame which
+    shows its result being presented.
+    """
+
+    def __init__(self, mode: str = "blocking", budget: float = FRAME_BUDGET):
+        assert mode in ("blocking", "paced"), mode
+        self.mode = mode
+        self.budget = budget
+        self.pending: Deque[Tuple[float, tcod.event.Event]] = collections.deque()  # (arrival time, event)
+        self.unpresented: List[float] = []  # Arrival times of handled key presses not yet presented.
+        self.latencies: Deque[float] = collections.deque(maxlen=1000)
+
+    def _fetch(self, context: tcod.context.Context, block: bool) -> None:
+        events = tcod.event.wait() if block else tcod.event.get()
+        now = time.perf_counter()
+        for event in events:
+            context.convert_event(event)  # Sets the tile coordinates the handlers use.
+            if self.mode == "paced" and self.pending:
+                last = self.pending[-1][1]
+                if isinstance(event, tcod.event.MouseMotion) and isinstance(last, tcod.event.MouseMotion):
+                    # Only the latest position matters.
+                    self.pending[-1] = (self.pending[-1][0], event)
+                    continue
+                if isinstance(event, tcod.event.KeyDown) and event.repeat and self._repeat_pending(event):
+                    continue  # Don't let a held key queue up turns faster than they are shown.
+            self.pending.append((now, event))
+
+    def _repeat_pending(self, event: tcod.event.KeyDown) -> bool:
+        return any(
+            isinstance(other, tcod.event.KeyDown) and other.repeat and other.sym == event.sym
+            for _, other in self.pending
+        )
+
+    def events(self, context: tcod.context.Context) -> Iterator[tcod.event.Event]:
+        """Yield the events to handle before the next frame."""
+        if self.mode == "blocking":
+            self._fetch(context, block=True)
+        else:
+            self._fetch(context, block=not self.pending)
+        deadline = time.perf_counter() + self.budget
+        while self.pending:
+            if self.mode == "paced" and time.perf_counter() > deadline:
+                break
+            arrival, event = self.pending.popleft()
+            if isinstance(event, tcod.event.KeyDown):
+                self.unpresented.append(arrival)
+            yield event
+
+    def presented(self) -> None:
+        """Call after a frame is presented."""
+        now = time.perf_counter()
+        self.latencies.extend(now - arrival for arrival in self.unpresented)
+        self.unpresented.clear()
+
+    def latency_report(self) -> str:
+        """Return the key press to present latency percentiles."""
+        if not self.latencies:
+            return "No input latency samples."
+        samples = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000
+
+        return (
+            f"Input latency ({self.mode}, {len(samples)} key presses):"
+            f" p50 {percentile(50):.1f} ms, p90 {percentile(90):.1f} ms, p99 {percentile(99):.1f} ms."
+        )
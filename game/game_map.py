@@ -1,14 +1,30 @@
 from __future__ import annotations
 
-from typing import Iterable, Iterator, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import numpy as np
 import tcod
 
+import game.chunks
 import game.engine
 import game.entity
+import game.floor_store
+import game.profiler
 import game.tiles
 
+DORMANT_DISTANCE = 15  # Idle actors further than this from the player stop taking turns.
+VIEW_WIDTH = 80  # Size of the map area of the screen, larger maps scroll with the player.
+VIEW_HEIGHT = 44
+
+# Glyphs of the items and corpses on each tile, a priority of 0 means the tile has none.
+object_glyph_dt = np.dtype(
+    [
+        ("ch", np.int32),
+        ("fg", "3B"),
+        ("priority", np.int8),  # The RenderOrder value of the entity shown.
+    ]
+)
+
 
 class GameMap:
     def __init__(
@@ -16,22 +32,201 @@ class GameMap:
     ):
         self.engine = engine
         self.width, self.height = width, height
-        self.entities = set(entities)
-        self.tiles = np.full((width, height), fill_value=game.tiles.wall, order="F")
+        self.entities: Set[game.entity.Entity] = set()
+        self.all_actors: Set[game.entity.Actor] = set()  # The Actors in `entities`, living or dead.
+        # Entities on each tile in the order they arrived, so the last item is the top of a pile.
+        self.tile_entities: Dict[Tuple[int, int], List[game.entity.Entity]] = {}
+        # Layers are chunked, so they only use memory where something is on them.
+        # Drawn over the tiles, everything except actors is only updated when it is added or removed.
+        self.object_glyphs = game.chunks.ChunkedArray((width, height), object_glyph_dt)
+        # Indexes into `game.tiles.tile_types`.
+        self.tiles = game.chunks.ChunkedArray((width, height), np.uint8, fill_value=game.tiles.WALL)
 
-        self.visible = np.full((width, height), fill_value=False, order="F")  # Tiles the player can currently see
-        self.explored = np.full((width, height), fill_value=False, order="F")  # Tiles the player has seen before
+        self.visible = game.chunks.ChunkedArray((width, height), bool)  # Tiles the player can currently see
+        self.visible_window = (slice(0, width), slice(0, height))  # The part of `visible` which may be True.
+        self.explored = game.chunks.ChunkedArray((width, height), bool)  # Tiles the player has seen before
 
         self.downstairs_location = (0, 0)
+        self.upstairs_location = (0, 0)  # Where the player arrives from the floor above.
+
+        self.awake_actors: Set[game.entity.Actor] = set()  # Living actors which are not dormant, these take turns.
+        self.dormant: Set[game.entity.Actor] = set()  # Actors left out of the turn order until woken.
+        self.hostile_actors: Set[game.entity.Actor] = set()  # Living actors whose AI is hostile.
+
+        for entity in entities:
+            self.add_entity(entity)
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Convert the dense arrays of maps saved before their layers were chunked."""
+        if isinstance(state.get("tiles"), np.ndarray):
+            state["tiles"] = game.chunks.ChunkedArray.from_dense(
+                game.tiles.tile_ids(state["tiles"]), fill_value=game.tiles.WALL
+            )
+        for name in ("visible", "explored", "object_glyphs"):
+            if isinstance(state.get(name), np.ndarray):
+                state[name] = game.chunks.ChunkedArray.from_dense(state[name])
+        self.__dict__.update(state)
+
+    def __getattr__(self, name: str) -> Any:
+        """Fill in the state of maps saved before it existed, on first use.
+
+        Each missing attribute `name` is made by the `_default_name` method.
+        """
+        default = getattr(type(self), f"_default_{name}", None)
+        if default is None or "tiles" not in self.__dict__:
+            raise AttributeError(name)
+        value = self.__dict__[name] = default(self)
+        return value
+
+    def _default_upstairs_location(self) -> Tuple[int, int]:
+        return 0, 0  # Only used when arriving from the floor above, which older saves never kept.
+
+    def _default_dormant(self) -> Set[game.entity.Actor]:
+        return set()  # Everything starts awake, idle actors go dormant again on their next turn.
+
+    def _default_awake_actors(self) -> Set[game.entity.Actor]:
+        return {actor for actor in self.actors if actor not in self.dormant}
+
+    def _default_hostile_actors(self) -> Set[game.entity.Actor]:
+        return {actor for actor in self.actors if actor.ai and actor.ai.is_hostile}
+
+    def _default_visible_window(self) -> Tuple[slice, slice]:
+        return slice(0, self.width), slice(0, self.height)  # Anything might be visible until the FOV is updated.
+
+    def _default_tile_entities(self) -> Dict[Tuple[int, int], List[game.entity.Entity]]:
+        # Saves which indexed only items by tile keep the order of their piles.
+        stacks: Dict[Tuple[int, int], List[game.entity.Item]] = self.__dict__.pop("item_stacks", {})
+        stacked = {item for stack in stacks.values() for item in stack}
+        tile_entities: Dict[Tuple[int, int], List[game.entity.Entity]] = {}
+        for entity in self.entities:
+            if entity not in stacked:
+                tile_entities.setdefault((entity.x, entity.y), []).append(entity)
+        for position, stack in stacks.items():
+            tile_entities.setdefault(position, []).extend(stack)
+        return tile_entities
+
+    def _default_object_glyphs(self) -> game.chunks.ChunkedArray:
+        self.object_glyphs = game.chunks.ChunkedArray((self.width, self.height), object_glyph_dt)
+        for x, y in self.tile_entities:
+            self._redraw_objects(x, y)
+        return self.object_glyphs
+
+    def _default_all_actors(self) -> Set[game.entity.Actor]:
+        return {entity for entity in self.entities if isinstance(entity, game.entity.Actor)}
 
     @property
     def gamemap(self) -> GameMap:
         return self
 
+    def add_entity(self, entity: game.entity.Entity) -> None:
+        """Add an entity to this map at its current position."""
+        self.entities.add(entity)
+        self.tile_entities.setdefault((entity.x, entity.y), []).append(entity)
+        if isinstance(entity, game.entity.Actor):
+            self.all_actors.add(entity)
+            if entity.is_alive:
+                self.awake_actors.add(entity)
+        else:
+            self._draw_object(entity)
+
+    def remove_entity(self, entity: game.entity.Entity) -> None:
+        """Remove an entity from this map, this must be done before changing the position of an entity."""
+        self.entities.remove(entity)
+        on_tile = self.tile_entities[entity.x, entity.y]
+        on_tile.remove(entity)
+        if not on_tile:
+            del self.tile_entities[entity.x, entity.y]
+        if isinstance(entity, game.entity.Actor):
+            self.all_actors.discard(entity)
+            self.awake_actors.discard(entity)
+            self.dormant.discard(entity)
+        else:
+            self._redraw_objects(entity.x, entity.y)
+
+    def _draw_object(self, entity: game.entity.Entity) -> None:
+        """Show `entity` in the object layer, unless its tile shows something with a higher render order."""
+        priority = entity.render_order.value
+        if priority >= self.object_glyphs[entity.x, entity.y]["priority"]:
+            self.object_glyphs[entity.x, entity.y] = ord(entity.char), entity.color, priority
+
+    def _redraw_objects(self, x: int, y: int) -> None:
+        """Update the object layer at `x`, `y` from what is left on that tile."""
+        self.object_glyphs[x, y] = 0, (0, 0, 0), 0
+        for entity in self.tile_entities.get((x, y), ()):
+            if not isinstance(entity, game.entity.Actor):
+                self._draw_object(entity)
+
+    def entities_at(self, x: int, y: int) -> List[game.entity.Entity]:
+        """Return the entities on a tile, in the order they arrived."""
+        return list(self.tile_entities.get((x, y), ()))
+
+    def items_at(self, x: int, y: int) -> List[game.entity.Item]:
+        """Return the items on a tile, the one on top last."""
+        return [entity for entity in self.tile_entities.get((x, y), ()) if isinstance(entity, game.entity.Item)]
+
     @property
     def actors(self) -> Iterator[game.entity.Actor]:
         """Iterate over this maps living actors."""
-        yield from (entity for entity in self.entities if isinstance(entity, game.entity.Actor) and entity.is_alive)
+        yield from (actor for actor in self.all_actors if actor.is_alive)
+
+    @property
+    def active_actors(self) -> Iterator[game.entity.Actor]:
+        """Iterate over the living actors which are not dormant, these are the ones which take turns."""
+        yield from (actor for actor in self.awake_actors if actor.is_alive)
+
+    def should_sleep(self, actor: game.entity.Actor) -> bool:
+        """Return True if `actor` is idle and far enough from the player to go dormant."""
+        player = self.engine.player
+        return (
+            actor is not player
+            and actor.ai is not None
+            and actor.ai.is_idle()
+            and max(abs(actor.x - player.x), abs(actor.y - player.y)) > DORMANT_DISTANCE
+        )
+
+    def sleep(self, actor: game.entity.Actor) -> None:
+        """Take `actor` out of the turn order until it is woken."""
+        self.awake_actors.discard(actor)
+        self.dormant.add(actor)
+
+    def _dormant_on(self, xs: np.ndarray, ys: np.ndarray) -> List[game.entity.Actor]:
+        """Return the dormant actors on the tiles at the coordinate arrays `xs`, `ys`."""
+        return [
+            entity
+            for position in zip(xs.tolist(), ys.tolist())
+            for entity in self.tile_entities.get(position, ())
+            if entity in self.dormant
+        ]
+
+    def wake(self, actor: game.entity.Actor) -> None:
+        """Wake a dormant actor, along with any dormant actors next to it and so on."""
+        waking = [actor]
+        while waking:
+            current = waking.pop()
+            if current not in self.dormant:
+                continue
+            self.dormant.remove(current)
+            self.awake_actors.add(current)
+            xs, ys = self._around(current.x, current.y, 1)
+            waking.extend(self._dormant_on(xs, ys))
+
+    def wake_visible(self) -> None:
+        """Wake every dormant actor the player can see, only the tiles of the FOV window are looked at."""
+        if not self.dormant:
+            return
+        window_x, window_y = self.visible_window
+        xs, ys = np.nonzero(self.visible[self.visible_window])
+        for actor in self._dormant_on(xs + window_x.start, ys + window_y.start):
+            self.wake(actor)
+
+    def make_noise(self, x: int, y: int, radius: int) -> None:
+        """Wake every dormant actor within `radius` of a noise at `x`, `y`, only the tiles around it are looked at."""
+        if not self.dormant:
+            return
+        xs, ys = self._around(x, y, radius)
+        inside = (xs - x) ** 2 + (ys - y) ** 2 <= radius**2
+        for actor in self._dormant_on(xs[inside], ys[inside]):
+            self.wake(actor)
 
     @property
     def items(self) -> Iterator[game.entity.Item]:
@@ -42,47 +237,144 @@ class GameMap:
         location_x: int,
         location_y: int,
     ) -> Optional[game.entity.Entity]:
-        for entity in self.entities:
-            if entity.blocks_movement and entity.x == location_x and entity.y == location_y:
+        for entity in self.tile_entities.get((location_x, location_y), ()):
+            if entity.blocks_movement:
                 return entity
 
         return None
 
     def get_actor_at_location(self, x: int, y: int) -> Optional[game.entity.Actor]:
-        for actor in self.actors:
-            if actor.x == x and actor.y == y:
-                return actor
+        for entity in self.tile_entities.get((x, y), ()):
+            if isinstance(entity, game.entity.Actor) and entity.is_alive:
+                return entity
+
+        return None
+
+    def _actors_on(self, xs: np.ndarray, ys: np.ndarray) -> List[game.entity.Actor]:
+        """Return the living actors on the tiles at the coordinate arrays `xs`, `ys`, in the order of the tiles."""
+        actors = []
+        for position in zip(xs.tolist(), ys.tolist()):
+            for entity in self.tile_entities.get(position, ()):
+                if isinstance(entity, game.entity.Actor) and entity.is_alive:
+                    actors.append(entity)
+        return actors
+
+    def _around(self, x: int, y: int, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the coordinates of every tile of the map within `radius` of `x`, `y` on both axes."""
+        reach = int(radius)
+        xs, ys = np.mgrid[
+            max(0, x - reach) : min(self.width, x + reach + 1), max(0, y - reach) : min(self.height, y + reach + 1)
+        ]
+        return xs.ravel(), ys.ravel()
+
+    def actors_in_radius(self, x: int, y: int, radius: float) -> List[game.entity.Actor]:
+        """Return the actors within `radius` of `x`, `y`, by Euclidean distance.
+
+        Only the tiles around `x`, `y` are looked at, so this does not depend on the number of actors on the map.
+        """
+        xs, ys = self._around(x, y, radius)
+        inside = (xs - x) ** 2 + (ys - y) ** 2 <= radius**2
+        return self._actors_on(xs[inside], ys[inside])
+
+    def actors_in_mask(self, mask: np.ndarray, origin: Tuple[int, int] = (0, 0)) -> List[game.entity.Actor]:
+        """Return the actors standing on tiles where the boolean `mask` is True.
+
+        `mask` covers a window of the map with its top left at `origin`, only the tiles it marks are looked at.
+        """
+        xs, ys = np.nonzero(mask)
+        return self._actors_on(xs + origin[0], ys + origin[1])
 
+    def nearest_visible_actor(
+        self, x: int, y: int, max_distance: float, exclude: Optional[game.entity.Actor] = None
+    ) -> Optional[game.entity.Actor]:
+        """Return the visible actor closest to `x`, `y` and closer than `max_distance`, or None.
+
+        Actors at the same distance are picked from in map order, so the result is repeatable.
+        """
+        xs, ys = self._around(x, y, max_distance)
+        distance = np.hypot(xs - x, ys - y)
+        candidates = (distance < max_distance) & self.visible[xs, ys]
+        order = np.argsort(distance[candidates], kind="stable")
+        for actor in self._actors_on(xs[candidates][order], ys[candidates][order]):
+            if actor is not exclude:
+                return actor
         return None
 
     def in_bounds(self, x: int, y: int) -> bool:
         """Return True if x and y are inside of the bounds of this map."""
         return 0 <= x < self.width and 0 <= y < self.height
 
+    def camera_origin(self) -> Tuple[int, int]:
+        """Return the map position shown at the top left of the screen.
+
+        The camera follows the player, and stops at the edges of the map.
+        """
+        player = self.engine.player
+        x = max(0, min(player.x - VIEW_WIDTH // 2, self.width - VIEW_WIDTH))
+        y = max(0, min(player.y - VIEW_HEIGHT // 2, self.height - VIEW_HEIGHT))
+        return x, y
+
+    def screen_to_world(self, x: int, y: int) -> Tuple[int, int]:
+        """Convert a screen position to a map position."""
+        origin_x, origin_y = self.camera_origin()
+        return x + origin_x, y + origin_y
+
+    def world_to_screen(self, x: int, y: int) -> Tuple[int, int]:
+        """Convert a map position to a screen position, which may be off the screen."""
+        origin_x, origin_y = self.camera_origin()
+        return x - origin_x, y - origin_y
+
+    @game.profiler.timed("GameMap.render")
     def render(self, console: tcod.console.Console) -> None:
         """
-        Renders the map.
+        Renders the part of the map under the camera.
 
         If a tile is in the "visible" array, then draw it with the "light" colors.
         If it isn't, but it's in the "explored" array, then draw it with the "dark" colors.
         Otherwise, the default is "SHROUD".
         """
-        console.rgb[0 : self.width, 0 : self.height] = np.select(
-            condlist=[self.visible, self.explored],
-            choicelist=[self.tiles["light"], self.tiles["dark"]],
+        origin_x, origin_y = self.camera_origin()
+        view = (
+            slice(origin_x, min(origin_x + VIEW_WIDTH, self.width)),
+            slice(origin_y, min(origin_y + VIEW_HEIGHT, self.height)),
+        )
+        tiles = game.tiles.tile_types[self.tiles[view]]
+        visible = self.visible[view]
+        console.rgb[0 : tiles.shape[0], 0 : tiles.shape[1]] = np.select(
+            condlist=[visible, self.explored[view]],
+            choicelist=[tiles["light"], tiles["dark"]],
             default=game.tiles.SHROUD,
         )
 
-        entities_sorted_for_rendering = sorted(self.entities, key=lambda x: x.render_order.value)
+        # Items and corpses come from the object layer, in one assignment per field.
+        objects = self.object_glyphs[view]
+        shown = visible & (objects["priority"] > 0)
+        screen = console.rgb[0 : tiles.shape[0], 0 : tiles.shape[1]]
+        screen["ch"][shown] = objects["ch"][shown]
+        screen["fg"][shown] = objects["fg"][shown]
+
+        # Actors are looked up on the visible tiles of the view, so drawing them does not depend on the map size.
+        xs, ys = np.nonzero(visible)
+        actors_sorted_for_rendering = sorted(
+            (
+                entity
+                for position in zip((xs + origin_x).tolist(), (ys + origin_y).tolist())
+                for entity in self.tile_entities.get(position, ())
+                if isinstance(entity, game.entity.Actor)
+            ),
+            key=lambda x: x.render_order.value,
+        )
 
-        for entity in entities_sorted_for_rendering:
-            if self.visible[entity.x, entity.y]:
-                console.print(x=entity.x, y=entity.y, string=entity.char, fg=entity.color)
+        for actor in actors_sorted_for_rendering:
+            console.print(x=actor.x - origin_x, y=actor.y - origin_y, string=actor.char, fg=actor.color)
 
 
 class GameWorld:
     """
     Holds the settings for the GameMap, and generates new maps when moving down the stairs.
+
+    Only floors within `resident_radius` of the current floor are kept in memory,
+    the rest are paged out to a FloorStore and loaded back when visited.
     """
 
     def __init__(
@@ -95,6 +387,8 @@ class GameWorld:
         room_min_size: int,
         room_max_size: int,
         current_floor: int = 0,
+        floor_directory: str = "savegame.floors",
+        resident_radius: int = 1,
     ):
         self.engine = engine
 
@@ -108,6 +402,26 @@ class GameWorld:
 
         self.current_floor = current_floor
 
+        self.floors: Dict[int, GameMap] = {}  # Resident floors by floor number.
+        self.floor_store = game.floor_store.FloorStore(floor_directory)
+        self.resident_radius = resident_radius
+
+    def has_floor(self, floor: int) -> bool:
+        """Return True if `floor` has already been generated."""
+        return floor in self.floors or floor in self.floor_store
+
+    def get_floor(self, floor: int) -> GameMap:
+        """Return the GameMap for an existing floor, loading it from the store if needed."""
+        if floor not in self.floors:
+            self.floors[floor] = self.floor_store.load(floor, self.engine)
+        return self.floors[floor]
+
+    def page_out_floors(self) -> None:
+        """Move floors too far from the current floor out of memory."""
+        for floor in list(self.floors):
+            if abs(floor - self.current_floor) > self.resident_radius:
+                self.floor_store.save(floor, self.floors.pop(floor))
+
     def generate_floor(self) -> None:
         import game.procgen
 
@@ -120,4 +434,29 @@ class GameWorld:
             map_width=self.map_width,
             map_height=self.map_height,
             engine=self.engine,
+            rng=self.engine.rng.split("floor", self.current_floor),
         )
+        self.floors[self.current_floor] = self.engine.game_map
+        self.page_out_floors()
+
+    def change_floor(self, floor: int) -> None:
+        """Move the player to an existing floor.
+
+        The player arrives at the up stairs when going down and at the down stairs when going up.
+        """
+        game_map = self.get_floor(floor)
+        if floor > self.current_floor:
+            location = game_map.upstairs_location
+        else:
+            location = game_map.downstairs_location
+        self.current_floor = floor
+        self.engine.game_map = game_map
+        self.engine.player.place(*location, game_map)
+        self.page_out_floors()
+
+    def descend(self) -> None:
+        """Go to the next floor down, generating it if it has not been visited."""
+        if self.has_floor(self.current_floor + 1):
+            self.change_floor(self.current_floor + 1)
+        else:
+            self.generate_floor()
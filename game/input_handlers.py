@@ -16,6 +16,10 @@ import game.color as color
 import game.engine
 import game.entity
 import game.exceptions
+import game.menus
+import game.profiler
+import game.replay
+import game.travel
 import game.attachment_types
 import game.components.attachments
 
@@ -51,6 +55,14 @@ HEAL_KEYS = {
     tcod.event.KeySym.BACKQUOTE,
 }
 
+EXPLORE_KEYS = {
+    tcod.event.KeySym.o,
+}
+
+TRAVEL_TO_STAIRS_KEYS = {
+    tcod.event.KeySym.t,
+}
+
 CONFIRM_KEYS = {
     tcod.event.KeySym.RETURN,
     tcod.event.KeySym.KP_ENTER,
@@ -133,6 +145,7 @@ class EventHandler(BaseEventHandler):
         if action is None:
             return False
 
+        game.replay.record_action(self.engine, action)
         try:
             action.perform()
         except game.exceptions.Impossible as exc:
@@ -145,8 +158,9 @@ class EventHandler(BaseEventHandler):
         return True
 
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
-        if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+        x, y = self.engine.game_map.screen_to_world(event.tile.x, event.tile.y)
+        if self.engine.game_map.in_bounds(x, y):
+            self.engine.mouse_location = x, y
 
     def on_render(self, console: tcod.Console) -> None:
         self.engine.render(console)
@@ -158,16 +172,49 @@ class WaitHealEventHandler(EventHandler):
         self.engine = engine
 
     def wait_to_heal(self):
-        while (self.engine.player.fighter.hp < self.engine.player.fighter.max_hp):
+        """Rest one turn per hit point until healed.
+
+        While nothing else on the map would act the remaining turns are skipped
+        at once, otherwise the rest continues a turn at a time.
+        """
+        game.replay.record(game.replay.Command.REST)
+        fighter = self.engine.player.fighter
+        while (fighter.hp < fighter.max_hp):
             if (self.engine.review_hostile_enemies()):
                 self.engine.message_log.add_message("Sleep aborted, hostile enemies detected.", game.color.needs_target)
                 return MainGameEventHandler(self.engine)
-            self.engine.player.fighter.hp += 1
-            self.engine.handle_enemy_turns()
+            if self.engine.can_fast_forward():
+                turns = fighter.max_hp - fighter.hp
+                fighter.hp += turns
+                self.engine.fast_forward_rest(turns)
+            else:
+                fighter.hp += 1
+                self.engine.rest_turn()
         return MainGameEventHandler(self.engine)
 
         #console.print(x=x + 1, y=y + 1, string=f"Level: {self.engine.player.level.current_level}")
 
+class TravelEventHandler(EventHandler):
+    """Handles walking the player over many turns, for auto-explore and travel."""
+
+    def __init__(self, engine: game.engine.Engine):
+        self.engine = engine
+
+    def travel(self, goal: Optional[Tuple[int, int]] = None) -> EventHandler:
+        """Travel to `goal`, or explore if `goal` is None, then report why travel stopped."""
+        if goal is None:
+            game.replay.record(game.replay.Command.EXPLORE)
+        else:
+            game.replay.record(game.replay.Command.TRAVEL, x=goal[0], y=goal[1])
+        start = self.engine.player.x, self.engine.player.y
+        reason = game.travel.travel(self.engine, goal)
+        if not self.engine.player.is_alive:
+            return GameOverEventHandler(self.engine)
+        color = game.color.white if (self.engine.player.x, self.engine.player.y) != start else game.color.impossible
+        self.engine.message_log.add_message(reason, color)
+        return MainGameEventHandler(self.engine)
+
+
 class AskUserEventHandler(EventHandler):
     """Handles user input for actions which require special input."""
 
@@ -234,19 +281,20 @@ class CharacterScreenEventHandler(AskUserEventHandler):
 
 class AttachmentEventHandler(AskUserEventHandler):
     TITLE = "Socket Equipment Screen"
+    MAX_ROWS = 34  # Rows which fit inside of the frame, longer lists scroll.
 
     def __init__(self, engine: game.engine.Engine):
         super().__init__(engine)
         self.selected_index = 0
+        self.scroll = 0
+        self.view = game.menus.socket_view(engine.player.attachments)
 
     def on_render(self, console: tcod.console.Console) -> None:
-        from game.components.attachable import Attachable, Socket
-
         """
         Render an attachment menu, which displays the attacments the player has equipped, and the letter to select them.
         """
         super().on_render(console)
-        number_of_total_sockets = len(self.engine.player.attachments.get_sockets())
+        rows = self.view.rows
 
         height = 36
 
@@ -264,49 +312,23 @@ class AttachmentEventHandler(AskUserEventHandler):
 
         console.print(1, 1, f" {self.TITLE} ", fg=(201, 113, 30), bg=(32, 20, 6)) #TODO: ADD THESE COLORS TO THE COLOR LIST
 
-        if number_of_total_sockets > 0:
-            previous_socket : Socket = None
-            socket_depth = 0
-            for i, socket in enumerate(self.engine.player.attachments.get_sockets()):
-                #Find socket depth for indenting
-                if previous_socket == None or previous_socket.parent == socket.parent:
-                    pass
-                elif socket.is_decendent_of(previous_socket):
-                    socket_depth += 1
-                else: 
-                    socket_depth -= 1
-
-                spacer = " " * socket_depth
-                if socket_depth > 0:
-                    spacer += "∟"
-
-                if (socket.attachment == None):
-                    type_string = ""
-                    if socket.type == game.attachment_types.AttachmentType.CHASSIS:
-                        type_string = "Empty Chassis Socket"
-                    elif socket.type == game.attachment_types.AttachmentType.JOINT:
-                        type_string = f"Empty Joint Socket"
-                    elif socket.type == game.attachment_types.AttachmentType.APPENDAGE:
-                        type_string = f"Empty Appendage Socket"
-                    elif socket.type == game.attachment_types.AttachmentType.WEAPON:
-                        type_string = f"Empty Weapon Socket"
-                    socket_string = f"{spacer}{type_string}"
-
-                else:
-                    socket_string = f"{spacer}{socket.attachment.name}"
-
-                if i == self.selected_index:
-                    socket_string += " <-"
-
-                #TODO: un-magic-numberify this 
-                previous_socket = socket
-                console.print(1 + 3, 3 + i + 1, socket_string)
+        # Detaching removes the sockets under the attachment as well.
+        self.selected_index = max(0, min(self.selected_index, len(rows) - 1))
+        self.scroll = game.menus.scroll_offset(self.selected_index, self.scroll, len(rows), self.MAX_ROWS)
+        for i, row in enumerate(rows[self.scroll : self.scroll + self.MAX_ROWS]):
+            socket_string = row.text
+
+            if self.scroll + i == self.selected_index:
+                socket_string += " <-"
+
+            #TODO: un-magic-numberify this 
+            console.print(1 + 3, 3 + i + 1, socket_string)
                 
 
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
         key = event.sym
         
-        socket_count = len(self.engine.player.attachments.get_sockets())
+        socket_count = len(self.view)
         
         if key == tcod.event.KeySym.KP_2:
             self.selected_index += 1
@@ -323,7 +345,7 @@ class AttachmentEventHandler(AskUserEventHandler):
             tcod.event.KeySym.KP_ENTER,
             tcod.event.KeySym.RETURN
         }:
-            return self.on_item_selected(self.engine.player.attachments.get_sockets()[self.selected_index])
+            return self.on_item_selected(self.view.rows[self.selected_index].value)
         
         return super().ev_keydown(event)
     
@@ -333,14 +355,15 @@ class AttachmentEventHandler(AskUserEventHandler):
             self.engine.message_log.add_message("Invalid entry.", game.color.invalid)
             return AttachmentSelectionEventHandler(self.engine, self, self.selected_index)
         
-        self.engine.player.inventory.items.append(socket.attachment)
-        socket.detach()
+        game.replay.record(game.replay.Command.DETACH, x=self.selected_index)
+        self.engine.player.inventory.add(self.engine.player.attachments.detach(self.selected_index))
         return
     
 class AttachmentSelectionEventHandler(AskUserEventHandler):
 
     MIN_WINDOW_HEIGHT = 2
     MIN_SIZE_HEIGHT = 23
+    MAX_ROWS = 20  # Longer lists scroll.
     WINDOW_WIDTH = 40
     TITLE = "Choose an attachment"
 
@@ -349,23 +372,20 @@ class AttachmentSelectionEventHandler(AskUserEventHandler):
         self.parent = parent
         self.socket_index = socket_index
         self.selected_index = 0
+        self.scroll = 0
+        socket_type = engine.player.attachments.get_sockets()[socket_index].type
+        self.view = game.menus.attachment_choice_view(engine.player.inventory, socket_type)
 
     def on_render(self, console: tcod.console.Console) -> None:
-        from game.components.attachable import Attachable, Socket
-
         super().on_render(console)
 
         self.parent.on_render(console)
         console.rgb["fg"] //= 2
         console.rgb["bg"] //= 2
 
-        player = self.engine.player
-
-        all_sockets = player.attachments.get_sockets()
+        available_attachments = self.view.rows
 
-        available_attachments = list(filter(lambda item : item.attachable != None and item.attachable.type == all_sockets[self.socket_index].type, player.inventory.items))
-
-        height = self.MIN_WINDOW_HEIGHT + max(1, len(available_attachments))
+        height = self.MIN_WINDOW_HEIGHT + max(1, min(len(available_attachments), self.MAX_ROWS))
 
         
 
@@ -386,11 +406,14 @@ class AttachmentSelectionEventHandler(AskUserEventHandler):
         console.print(left, top - 1, f" {self.TITLE} ", fg=color.pale_sand, bg=tuple(ti//2 for ti in color.dark_brown))
 
         if len(available_attachments) > 0:
-            for i, attachment in enumerate(available_attachments):
+            self.scroll = game.menus.scroll_offset(
+                self.selected_index, self.scroll, len(available_attachments), self.MAX_ROWS
+            )
+            for i, row in enumerate(available_attachments[self.scroll : self.scroll + self.MAX_ROWS]):
 
-                attachment_string = attachment.name
+                attachment_string = row.text
 
-                if i == self.selected_index: 
+                if self.scroll + i == self.selected_index: 
                     attachment_string += " <-"
 
                 console.print(left + 1, top + 1 + i, attachment_string, color.white, color.dark_brown)
@@ -399,10 +422,8 @@ class AttachmentSelectionEventHandler(AskUserEventHandler):
                 
 
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
-        player = self.engine.player
         key = event.sym
-        all_sockets = player.attachments.get_sockets()
-        available_attachments = list(filter(lambda item : item.attachable != None and item.attachable.type == all_sockets[self.socket_index].type, player.inventory.items))
+        available_attachments = self.view.rows
         
         if key == tcod.event.KeySym.KP_2:
             self.selected_index += 1
@@ -420,7 +441,7 @@ class AttachmentSelectionEventHandler(AskUserEventHandler):
             tcod.event.KeySym.RETURN
         }:
             if len(available_attachments) > 0:
-                return self.on_item_selected(available_attachments[self.selected_index])
+                return self.on_item_selected(available_attachments[self.selected_index].value)
             else:
                 return self.parent
         
@@ -428,7 +449,8 @@ class AttachmentSelectionEventHandler(AskUserEventHandler):
             return self.parent
     
     def on_item_selected(self, item: game.entity.Item) -> Optional[ActionOrHandler]:
-        self.engine.player.inventory.items.remove(item)
+        game.replay.record(game.replay.Command.ATTACH, self.engine.player.inventory.items.index(item), self.socket_index)
+        self.engine.player.inventory.remove(item)
         self.engine.player.attachments.attach(item, self.socket_index)
         return self.parent
 
@@ -473,7 +495,7 @@ class AreYouSureEventHandler(AskUserEventHandler):
             return
     
     def on_item_selected(self, item: game.entity.Item) -> Optional[game.entity.Item]:
-        self.engine.player.inventory.items.remove(item)
+        self.engine.player.inventory.remove(item)
         return item
     
 
@@ -485,6 +507,12 @@ class InventoryEventHandler(AskUserEventHandler):
     """
 
     TITLE = "<missing title>"
+    MAX_ROWS = 26  # One for each letter, longer inventories scroll with the cursor keys.
+
+    def __init__(self, engine: game.engine.Engine):
+        super().__init__(engine)
+        self.scroll = 0
+        self.view = game.menus.inventory_view(engine.player)
 
     def on_render(self, console: tcod.console.Console) -> None:
         """Render an inventory menu, which displays the items in the inventory, and the letter to select them.
@@ -492,7 +520,7 @@ class InventoryEventHandler(AskUserEventHandler):
         they are.
         """
         super().on_render(console)
-        number_of_items_in_inventory = len(self.engine.player.inventory.items)
+        rows = self.view.rows
 
         height = 36
 
@@ -509,29 +537,25 @@ class InventoryEventHandler(AskUserEventHandler):
         )
         console.print(1, 1, f" {self.TITLE} ", fg=(201, 113, 30), bg=(32, 20, 6)) #TODO: MORE COLORS TO ADD TO THE COLOR FILE
 
-        if number_of_items_in_inventory > 0:
-            for i, item in enumerate(self.engine.player.inventory.items):
+        if len(rows) > 0:
+            self.scroll = max(0, min(self.scroll, len(rows) - self.MAX_ROWS))
+            for i, row in enumerate(rows[self.scroll : self.scroll + self.MAX_ROWS]):
                 item_key = chr(ord("a") + i)
 
-                is_equipped = self.engine.player.equipment.item_is_equipped(item)
-                
-                item_string = f"({item_key}) {item.name} x {item.count}"
-
-                if is_equipped:
-                    item_string = f"{item_string} (E)"
-
-                console.print(1 + 3, 3 + i + 1, item_string)
+                console.print(1 + 3, 3 + i + 1, f"({item_key}) {row.text}")
         else:
             console.print(1 + 1, 1 + 1, "(Empty)")
 
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
-        player = self.engine.player
         key = event.sym
         index = key - tcod.event.KeySym.a
 
-        if 0 <= index <= 26:
+        if key in CURSOR_Y_KEYS:
+            self.scroll = max(0, min(self.scroll + CURSOR_Y_KEYS[key], len(self.view) - self.MAX_ROWS))
+            return None
+        if 0 <= index < self.MAX_ROWS:
             try:
-                selected_item = player.inventory.items[index]
+                selected_item = self.view.rows[self.scroll + index].value
             except IndexError:
                 self.engine.message_log.add_message("Invalid entry.", game.color.invalid)
                 return None
@@ -555,8 +579,9 @@ class InventoryActivateHandler(InventoryEventHandler):
         elif item.equippable:
             return game.actions.EquipAction(100, self.engine.player, item)
         elif item.attachable:
+            game.replay.record(game.replay.Command.ATTACH, self.engine.player.inventory.items.index(item), -1)
             self.engine.player.attachments.attach(item)
-            self.engine.player.inventory.items.remove(item)
+            self.engine.player.inventory.remove(item)
             return
         else:
             return None
@@ -584,9 +609,10 @@ class SelectIndexHandler(AskUserEventHandler):
     def on_render(self, console: tcod.console.Console) -> None:
         """Highlight the tile under the cursor."""
         super().on_render(console)
-        x, y = self.engine.mouse_location
-        console.tiles_rgb["bg"][x, y] = game.color.white
-        console.tiles_rgb["fg"][x, y] = game.color.black
+        x, y = self.engine.game_map.world_to_screen(*self.engine.mouse_location)
+        if 0 <= x < console.width and 0 <= y < console.height:
+            console.tiles_rgb["bg"][x, y] = game.color.white
+            console.tiles_rgb["fg"][x, y] = game.color.black
 
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
         """Check for key movement or confirmation keys."""
@@ -615,9 +641,10 @@ class SelectIndexHandler(AskUserEventHandler):
 
     def ev_mousebuttondown(self, event: tcod.event.MouseButtonDown) -> Optional[ActionOrHandler]:
         """Left click confirms a selection."""
-        if self.engine.game_map.in_bounds(*event.tile):
+        x, y = self.engine.game_map.screen_to_world(*event.tile)
+        if self.engine.game_map.in_bounds(x, y):
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(x, y)
         return super().ev_mousebuttondown(event)
 
     def on_index_selected(self, x: int, y: int) -> Optional[ActionOrHandler]:
@@ -665,7 +692,7 @@ class AreaRangedAttackHandler(SelectIndexHandler):
         """Highlight the tile under the cursor."""
         super().on_render(console)
 
-        x, y = self.engine.mouse_location
+        x, y = self.engine.game_map.world_to_screen(*self.engine.mouse_location)
 
         # Draw a rectangle around the targeted area, so the player can see the affected tiles.
         console.draw_frame(
@@ -700,6 +727,10 @@ class MainGameEventHandler(EventHandler):
             action = game.actions.WaitAction(player)
         elif key in HEAL_KEYS:
             return WaitHealEventHandler(self.engine).wait_to_heal()
+        elif key in EXPLORE_KEYS:
+            return TravelEventHandler(self.engine).travel()
+        elif key in TRAVEL_TO_STAIRS_KEYS:
+            return TravelEventHandler(self.engine).travel(self.engine.game_map.downstairs_location)
 
         elif key == tcod.event.KeySym.ESCAPE:
             raise SystemExit()
@@ -707,6 +738,8 @@ class MainGameEventHandler(EventHandler):
             return HistoryViewer(self.engine)
         elif key == tcod.event.KeySym.e:
             return AttachmentEventHandler(self.engine)
+        elif key == tcod.event.KeySym.g and modifier & (tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT):
+            action = game.actions.PickupAction(player, pick_all=True)
         elif key == tcod.event.KeySym.g:
             action = game.actions.PickupAction(player)
 
@@ -716,6 +749,8 @@ class MainGameEventHandler(EventHandler):
             return InventoryDropHandler(self.engine)
         elif key == tcod.event.KeySym.x:
             return LookHandler(self.engine)
+        elif key == tcod.event.KeySym.F3:
+            game.profiler.profiler.toggle()
 
         # No valid key was pressed
         return action
@@ -723,7 +758,13 @@ class MainGameEventHandler(EventHandler):
         elif key == tcod.event.KeySym.c:
             return CharacterScreenEventHandler(self.engine)
         '''
-        
+
+    def ev_mousebuttondown(self, event: tcod.event.MouseButtonDown) -> Optional[ActionOrHandler]:
+        """Left click travels to the clicked tile."""
+        x, y = self.engine.game_map.screen_to_world(*event.tile)
+        if event.button == 1 and self.engine.game_map.in_bounds(x, y):
+            return TravelEventHandler(self.engine).travel((x, y))
+        return None
 
 
 class GameOverEventHandler(EventHandler):
@@ -731,6 +772,7 @@ class GameOverEventHandler(EventHandler):
         """Handle exiting out of a finished game."""
         if os.path.exists("savegame.sav"):
             os.remove("savegame.sav")  # Deletes the active save file.
+        self.engine.game_world.floor_store.clear()
         raise game.exceptions.QuitWithoutSaving()  # Avoid saving a finished game.
 
     def ev_quit(self, event: tcod.event.Quit) -> None:
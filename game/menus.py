@@ -0,0 +1,112 @@
+"""View models for the inventory and attachment menus.
+
+A MenuView builds its rows once and keeps them until the version key of the
+components it reads changes, so menus redraw from prepared strings instead of
+walking the inventory or socket tree every frame and key press.  Menus only
+draw the rows inside their window, scrolled to keep the selection in view.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+import game.attachment_types
+import game.components.attachable
+import game.components.attachments
+import game.components.inventory
+import game.entity
+
+EMPTY_SOCKET_NAMES = {
+    game.attachment_types.AttachmentType.CHASSIS: "Empty Chassis Socket",
+    game.attachment_types.AttachmentType.JOINT: "Empty Joint Socket",
+    game.attachment_types.AttachmentType.APPENDAGE: "Empty Appendage Socket",
+    game.attachment_types.AttachmentType.WEAPON: "Empty Weapon Socket",
+}
+
+
+class Row(NamedTuple):
+    text: str
+    value: Any  # The item or socket this row selects.
+
+
+class MenuView:
+    """Rows made by `build`, rebuilt only when `key` returns a different value."""
+
+    def __init__(self, build: Callable[[], List[Row]], key: Callable[[], Tuple[Any, ...]]):
+        self.build = build
+        self.key = key
+        self.built_key: Optional[Tuple[Any, ...]] = None
+        self._rows: List[Row] = []
+
+    @property
+    def rows(self) -> List[Row]:
+        key = self.key()
+        if key != self.built_key:
+            self._rows = self.build()
+            self.built_key = key
+        return self._rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def scroll_offset(selected: int, offset: int, count: int, window: int) -> int:
+    """Return the first row to show so that row `selected` is within `window` rows, moving `offset` as little as
+    possible."""
+    offset = max(min(offset, selected), selected - window + 1)
+    return max(0, min(offset, count - window))
+
+
+def inventory_view(actor: game.entity.Actor) -> MenuView:
+    """Rows for each item in `actor`'s inventory, with its count and whether it is equipped."""
+
+    def build() -> List[Row]:
+        rows = []
+        for item in actor.inventory.items:
+            text = f"{item.name} x {item.count}"
+            if actor.equipment.item_is_equipped(item):
+                text = f"{text} (E)"
+            rows.append(Row(text, item))
+        return rows
+
+    return MenuView(build, lambda: (actor.inventory.version, actor.equipment.weapon, actor.equipment.armor))
+
+
+def socket_view(attachments: game.components.attachments.Attachments) -> MenuView:
+    """Rows for each socket of `attachments`, indented by their depth in the socket tree."""
+
+    def build() -> List[Row]:
+        rows = []
+        previous_socket: Optional[game.components.attachable.Socket] = None
+        socket_depth = 0
+        for socket in attachments.get_sockets():
+            # Find socket depth for indenting
+            if previous_socket is None or previous_socket.parent == socket.parent:
+                pass
+            elif socket.is_decendent_of(previous_socket):
+                socket_depth += 1
+            else:
+                socket_depth -= 1
+
+            spacer = " " * socket_depth
+            if socket_depth > 0:
+                spacer += "∟"
+
+            if socket.attachment is None:
+                rows.append(Row(f"{spacer}{EMPTY_SOCKET_NAMES.get(socket.type, '')}", socket))
+            else:
+                rows.append(Row(f"{spacer}{socket.attachment.name}", socket))
+            previous_socket = socket
+        return rows
+
+    return MenuView(build, lambda: (attachments.version,))
+
+
+def attachment_choice_view(
+    inventory: game.components.inventory.Inventory, attachment_type: game.attachment_types.AttachmentType
+) -> MenuView:
+    """Rows for the items in `inventory` which fit a socket of `attachment_type`."""
+
+    def build() -> List[Row]:
+        return [Row(item.name, item) for item in inventory.attachables_of_type(attachment_type)]
+
+    return MenuView(build, lambda: (inventory.version,))
@@ -4,6 +4,7 @@ import textwrap
 import tcod
 
 import game.color
+import game.profiler
 
 
 class Message:
@@ -37,6 +38,7 @@ class MessageLog:
         else:
             self.messages.append(Message(text, fg))
 
+    @game.profiler.timed("MessageLog.render")
     def render(self, console: tcod.console.Console, x: int, y: int, width: int, height: int) -> None:
         """Render this log over the given area.
 
@@ -0,0 +1,86 @@
+"""Compare planning enemy paths on the thread pool against computing them one at a time.
+
+`game.components.ai.plan_paths` only uses the pool for groups of at least
+MIN_PARALLEL_PATHS paths, this measures where the pool starts to pay off.
+Each group size paths from spread out floor tiles to the player of a new
+game, the same work `plan_paths` hands to the pool.
+
+On a single CPU the pool can only add overhead, the time a group would take
+on more CPUs is then estimated as the serial time divided between the CPUs
+plus the overhead measured here.
+
+Run with `python -m game.path_benchmark`.
+"""
+from __future__ import annotations
+
+from typing import Callable, List, Optional
+import argparse
+import concurrent.futures
+import functools
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import game.engine
+import game.components.ai
+import game.tiles
+
+GROUP_SIZES = (1, 2, 3, 4, 6, 8, 12, 16)
+
+
+def median_time(function: Callable[[], object], repeat: int) -> float:
+    """Return the median time of `repeat` calls to `function`, in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import game.setup_game
+
+    parser = argparse.ArgumentParser(description="Time path planning on the pool against one path at a time.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    engine = game.setup_game.new_game(floor_directory=tempfile.mkdtemp(), seed=args.seed)
+    gamemap = engine.game_map
+    dest = engine.player.x, engine.player.y
+    floor = np.argwhere(game.tiles.tile_types["walkable"][gamemap.tiles[:, :]])
+    floor = floor[np.abs(floor - dest).max(axis=1) > 1]
+
+    cpu_count = os.cpu_count() or 1
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=cpu_count)
+    plan = functools.partial(game.components.ai.plan_path, gamemap.tiles)
+    print(f"{cpu_count} CPUs, MIN_PARALLEL_PATHS is {game.components.ai.MIN_PARALLEL_PATHS}.")
+    if cpu_count == 1:
+        print("Pool times for 2 and 4 CPUs are estimates: serial time / CPUs + measured pool overhead.")
+    # Every group size paths from the first tiles of the same spread out list, so larger groups only add paths.
+    all_jobs = []
+    for i in range(max(GROUP_SIZES)):
+        start = (int(floor[i * len(floor) // max(GROUP_SIZES)][0]), int(floor[i * len(floor) // max(GROUP_SIZES)][1]))
+        box = game.components.ai.path_box(gamemap, start, dest)
+        blocked = game.components.ai.blocked_positions(gamemap, box)
+        all_jobs.append((box, blocked, np.full(len(blocked), 10, np.int8), start, dest))
+    for size in GROUP_SIZES:
+        jobs = all_jobs[:size]
+        serial = median_time(lambda: list(map(plan, *zip(*jobs))), args.repeat)
+        pool = median_time(lambda: list(executor.map(plan, *zip(*jobs))), args.repeat)
+        line = f"{size:3} paths: serial {serial:7.3f} ms, pool {pool:7.3f} ms"
+        if cpu_count == 1:
+            overhead = max(0.0, pool - serial)
+            estimates = (serial / min(cpus, size) + overhead for cpus in (2, 4))
+            line += ", estimated pool on 2 CPUs {:7.3f} ms, on 4 CPUs {:7.3f} ms".format(*estimates)
+        print(line)
+    executor.shutdown()
+    engine.game_world.floor_store.clear()
+
+
+if __name__ == "__main__":
+    main()
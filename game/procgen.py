@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import Dict, Iterator, List, Tuple
+from typing import Dict, List, Tuple
 import random
 
+import numpy as np
 import tcod
 
 import game.engine
@@ -11,6 +12,7 @@ import game.factories.entity_factories
 from game.factories.limb_factories import *
 import game.factories.unit_factories
 import game.game_map
+import game.rng
 import game.tiles
 
 max_items_by_floor = [
@@ -57,6 +59,7 @@ def get_entities_at_random(
     weighted_chances_by_floor: Dict[int, List[Tuple[game.entity.Entity, int]]],
     number_of_entities: int,
     floor: int,
+    rng: random.Random,
 ) -> List[game.entity.Entity]:
     entity_weighted_chances = {}
 
@@ -73,7 +76,7 @@ def get_entities_at_random(
     entities = list(entity_weighted_chances.keys())
     entity_weighted_chance_values = list(entity_weighted_chances.values())
 
-    chosen_entities = random.choices(entities, weights=entity_weighted_chance_values, k=number_of_entities)
+    chosen_entities = rng.choices(entities, weights=entity_weighted_chance_values, k=number_of_entities)
 
     return chosen_entities
 
@@ -97,31 +100,40 @@ class RectangularRoom:
         """Return the inner area of this room as a 2D array index."""
         return slice(self.x1 + 1, self.x2), slice(self.y1 + 1, self.y2)
 
+    @property
+    def outer(self) -> Tuple[slice, slice]:
+        """Return the area of this room including its walls, as a 2D array index."""
+        return slice(self.x1, self.x2 + 1), slice(self.y1, self.y2 + 1)
+
     def intersects(self, other: RectangularRoom) -> bool:
         """Return True if this room overlaps with another RectangularRoom."""
         return self.x1 <= other.x2 and self.x2 >= other.x1 and self.y1 <= other.y2 and self.y2 >= other.y1
 
 
-def place_entities(room: RectangularRoom, dungeon: game.game_map.GameMap, floor_number: int) -> None:
-    number_of_monsters = random.randint(0, get_max_value_for_floor(max_monsters_by_floor, floor_number))
-    number_of_items = random.randint(0, get_max_value_for_floor(max_items_by_floor, floor_number))
+def place_entities(
+    room: RectangularRoom, dungeon: game.game_map.GameMap, floor_number: int, rng: game.rng.RandomStreams
+) -> None:
+    number_of_monsters = rng.world.randint(0, get_max_value_for_floor(max_monsters_by_floor, floor_number))
+    number_of_items = rng.loot.randint(0, get_max_value_for_floor(max_items_by_floor, floor_number))
 
-    monsters: List[game.entity.Entity] = get_entities_at_random(enemy_chances, number_of_monsters, floor_number)
-    items: List[game.entity.Entity] = get_entities_at_random(item_chances, number_of_items, floor_number)
+    monsters: List[game.entity.Entity] = get_entities_at_random(
+        enemy_chances, number_of_monsters, floor_number, rng.world
+    )
+    items: List[game.entity.Entity] = get_entities_at_random(item_chances, number_of_items, floor_number, rng.loot)
 
     for entity in monsters + items:
-        x = random.randint(room.x1 + 1, room.x2 - 1)
-        y = random.randint(room.y1 + 1, room.y2 - 1)
+        x = rng.world.randint(room.x1 + 1, room.x2 - 1)
+        y = rng.world.randint(room.y1 + 1, room.y2 - 1)
 
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities):
+        if not dungeon.entities_at(x, y):
             entity.spawn(dungeon, x, y)
 
 
-def tunnel_between(start: Tuple[int, int], end: Tuple[int, int]) -> Iterator[Tuple[int, int]]:
-    """Return an L-shaped tunnel between these two points."""
+def tunnel_between(start: Tuple[int, int], end: Tuple[int, int], rng: random.Random) -> np.ndarray:
+    """Return an L-shaped tunnel between these two points, as an array of (x, y) rows."""
     x1, y1 = start
     x2, y2 = end
-    if random.random() < 0.5:  # 50% chance.
+    if rng.random() < 0.5:  # 50% chance.
         # Move horizontally, then vertically.
         corner_x, corner_y = x2, y1
     else:
@@ -129,10 +141,9 @@ def tunnel_between(start: Tuple[int, int], end: Tuple[int, int]) -> Iterator[Tup
         corner_x, corner_y = x1, y2
 
     # Generate the coordinates for this tunnel.
-    for x, y in tcod.los.bresenham((x1, y1), (corner_x, corner_y)).tolist():
-        yield x, y
-    for x, y in tcod.los.bresenham((corner_x, corner_y), (x2, y2)).tolist():
-        yield x, y
+    return np.concatenate(
+        [tcod.los.bresenham((x1, y1), (corner_x, corner_y)), tcod.los.bresenham((corner_x, corner_y), (x2, y2))]
+    )
 
 
 def generate_dungeon(
@@ -142,49 +153,58 @@ def generate_dungeon(
     map_width: int,
     map_height: int,
     engine: game.engine.Engine,
+    rng: game.rng.RandomStreams,
 ) -> game.game_map.GameMap:
-    """Generate a new dungeon map."""
+    """Generate a new dungeon map, all of its randomness comes from `rng`."""
     player = engine.player
-    dungeon = game.game_map.GameMap(engine, map_width, map_height, entities=[player])
+    dungeon = game.game_map.GameMap(engine, map_width, map_height)
+    # Dug out as a plain array and copied into the chunked layer once at the end, writing chunks a tile at a time
+    # costs more than the rest of generation on large maps.
+    tiles = np.full((map_width, map_height), game.tiles.WALL, dtype=np.uint8)
+    # The outer area of every room so far, a room intersects another exactly when its outer area overlaps this.
+    claimed = np.zeros((map_width, map_height), dtype=bool)
 
     rooms: List[RectangularRoom] = []
 
     center_of_last_room = (0, 0)
 
     for _ in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
+        room_width = rng.world.randint(room_min_size, room_max_size)
+        room_height = rng.world.randint(room_min_size, room_max_size)
 
-        x = random.randint(0, dungeon.width - room_width - 1)
-        y = random.randint(0, dungeon.height - room_height - 1)
+        x = rng.world.randint(0, dungeon.width - room_width - 1)
+        y = rng.world.randint(0, dungeon.height - room_height - 1)
 
         # "RectangularRoom" class makes rectangles easier to work with
         new_room = RectangularRoom(x, y, room_width, room_height)
 
-        # Run through the other rooms and see if they intersect with this one.
-        if any(new_room.intersects(other_room) for other_room in rooms):
+        # See if this room intersects with any of the other rooms.
+        if claimed[new_room.outer].any():
             continue  # This room intersects, so go to the next attempt.
         # If there are no intersections then the room is valid.
+        claimed[new_room.outer] = True
 
         # Dig out this rooms inner area.
-        dungeon.tiles[new_room.inner] = game.tiles.floor
+        tiles[new_room.inner] = game.tiles.FLOOR
 
         if len(rooms) == 0:
             # The first room, where the player starts.
             player.place(*new_room.center, dungeon)
+            dungeon.upstairs_location = new_room.center
         else:  # All rooms after the first.
             # Dig out a tunnel between this room and the previous one.
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                dungeon.tiles[x, y] = game.tiles.floor
+            tunnel = tunnel_between(rooms[-1].center, new_room.center, rng.world)
+            tiles[tunnel[:, 0], tunnel[:, 1]] = game.tiles.FLOOR
 
             center_of_last_room = new_room.center
 
-        place_entities(new_room, dungeon, engine.game_world.current_floor)
+        place_entities(new_room, dungeon, engine.game_world.current_floor, rng)
 
-        dungeon.tiles[center_of_last_room] = game.tiles.down_stairs
+        tiles[center_of_last_room] = game.tiles.DOWN_STAIRS
         dungeon.downstairs_location = center_of_last_room
 
         # Finally, append the new room to the list.
         rooms.append(new_room)
 
+    dungeon.tiles[:, :] = tiles
     return dungeon
@@ -0,0 +1,110 @@
+"""Timing of the game's subsystems per frame, shown as an overlay with F3.
+
+Functions are timed with the `timed` decorator and blocks of code with
+`profiler.timer`.  While the profiler is disabled both only check a flag, so
+the instrumentation can stay in place.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Deque, Dict, Iterator, Tuple, TypeVar, TYPE_CHECKING
+import collections
+import contextlib
+import functools
+import time
+
+import tcod
+
+if TYPE_CHECKING:
+    import game.engine
+
+WINDOW = 60  # Frames kept for the rolling timings.
+OVERLAY_WIDTH = 40
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Profiler:
+    """Accumulates time per subsystem, the totals are pushed into rolling windows once per frame."""
+
+    def __init__(self, window: int = WINDOW):
+        self.enabled = False
+        self.window = window
+        self.current: Dict[str, float] = collections.defaultdict(float)  # Seconds since the last frame.
+        self.history: Dict[str, Deque[float]] = {}
+
+    def toggle(self) -> None:
+        self.enabled = not self.enabled
+        self.current.clear()
+        self.history.clear()
+
+    def add(self, name: str, seconds: float) -> None:
+        self.current[name] += seconds
+
+    @contextlib.contextmanager
+    def _timer(self, name: str, detail: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(f"{name} {detail}" if detail else name, time.perf_counter() - start)
+
+    def timer(self, name: str, detail: str = "") -> contextlib.AbstractContextManager[None]:
+        """Return a context manager which times its block under `name`, and `detail` such as an actor's name."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(name, detail)
+
+    def end_frame(self) -> None:
+        """Move this frame's totals into the rolling windows."""
+        for name, seconds in self.current.items():
+            if name not in self.history:
+                self.history[name] = collections.deque(maxlen=self.window)
+            self.history[name].append(seconds)
+        self.current.clear()
+
+    def rows(self) -> Iterator[Tuple[str, float, float]]:
+        """Yield the name, mean and max milliseconds of each timing, slowest first."""
+        stats = []
+        for name, samples in self.history.items():
+            stats.append((name, sum(samples) / len(samples) * 1000, max(samples) * 1000))
+        yield from sorted(stats, key=lambda row: row[1], reverse=True)
+
+    def render(self, console: tcod.console.Console, engine: game.engine.Engine) -> None:
+        """Draw the overlay with timings and entity counts."""
+        game_map = engine.game_map
+        entities = len(game_map.entities)
+        actors = sum(1 for _ in game_map.actors)
+        items = sum(1 for _ in game_map.items)
+        rows = list(self.rows())[: console.height - 6]
+
+        height = len(rows) + 5
+        x = console.width - OVERLAY_WIDTH
+        console.draw_frame(x=x, y=0, width=OVERLAY_WIDTH, height=height, title="Profiler (F3)", clear=True)
+        console.print(x=x + 1, y=1, string=f"Entities {entities}  Actors {actors}  Items {items}")
+        console.print(x=x + 1, y=2, string=f"{'ms per frame':<24}{'mean':>6}{'max':>7}")
+        for i, (name, mean, worst) in enumerate(rows):
+            console.print(x=x + 1, y=3 + i, string=f"{name[:24]:<24}{mean:6.2f}{worst:7.2f}")
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+profiler = Profiler()
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorate a function so that its calls are timed under `name` while the profiler is enabled."""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.add(name, time.perf_counter() - start)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-from typing import Tuple
+from typing import Dict, Tuple
 
 import tcod
 
 import game.color
 import game.engine
+import game.entity
 import game.game_map
 import game.components.fighter
 import game.components.stats
@@ -15,9 +16,14 @@ def get_names_at_location(x: int, y: int, game_map: game.game_map.GameMap) -> st
     if not game_map.in_bounds(x, y) or not game_map.visible[x, y]:
         return ""
 
-    names = ", ".join(entity.name for entity in game_map.entities if entity.x == x and entity.y == y)
+    names = [entity.name for entity in game_map.entities_at(x, y) if not isinstance(entity, game.entity.Item)]
+    # Items come from the tile's stack, top first, with repeated items counted.
+    stack_counts: Dict[str, int] = {}
+    for item in reversed(game_map.items_at(x, y)):
+        stack_counts[item.name] = stack_counts.get(item.name, 0) + 1
+    names += [name if count == 1 else f"{name} x{count}" for name, count in stack_counts.items()]
 
-    return names.capitalize()
+    return ", ".join(names).capitalize()
 
 def render_flat(console: tcod.console.Console,
                 colorFull: game.color) -> None:
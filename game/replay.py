@@ -0,0 +1,208 @@
+"""Recording of the player's commands, and headless replay for benchmarking.
+
+A recording is the seed of a new game followed by one fixed size record per
+player command.  Replaying starts a new game from the same seed and feeds the
+commands through the same code as the input handlers, so the same session can
+be timed against different builds of the game.
+
+Record with `python main.py --record session.rec`, and replay with
+`python -m game.replay session.rec`.
+"""
+from __future__ import annotations
+
+from enum import IntEnum
+from typing import BinaryIO, Iterator, List, Optional, Tuple, TYPE_CHECKING
+import argparse
+import hashlib
+import struct
+import tempfile
+import time
+
+if TYPE_CHECKING:
+    import game.actions
+
+import game.engine
+import game.input_handlers
+
+MAGIC = b"CYBRREC\0"
+VERSION = 1
+
+HEADER = struct.Struct("<8sIQ")  # Magic, format version, seed.
+RECORD = struct.Struct("<BHhh")  # Command, inventory index, x, y.
+
+
+class Command(IntEnum):
+    BUMP = 1  # x, y is the direction.
+    WAIT = 2
+    PICKUP = 3  # Index is 1 to pick up every item on the tile.
+    STAIRS = 4
+    USE = 5  # Item at index, x, y is the target.
+    DROP = 6
+    EQUIP = 7
+    REST = 8
+    EXPLORE = 9
+    TRAVEL = 10  # x, y is the destination.
+    ATTACH = 11  # Item at index, x is the socket index or -1 for the first free socket.
+    DETACH = 12  # x is the socket index.
+
+
+class Recorder:
+    """Write the commands of a game started with `start` to a file."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file: Optional[BinaryIO] = None
+
+    def start(self, seed: int) -> None:
+        """Begin a recording of a new game seeded with `seed`, replacing any earlier recording."""
+        self.close()
+        self.file = open(self.filename, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed))
+
+    def record(self, command: Command, index: int = 0, x: int = 0, y: int = 0) -> None:
+        if self.file is not None:
+            self.file.write(RECORD.pack(command, index, x, y))
+
+    def record_action(self, engine: game.engine.Engine, action: game.actions.Action) -> None:
+        """Record an action performed by the player."""
+        if self.file is None:
+            return
+        items = engine.player.inventory.items
+        if isinstance(action, game.actions.Bump):
+            self.record(Command.BUMP, x=action.dx, y=action.dy)
+        elif isinstance(action, game.actions.WaitAction):
+            self.record(Command.WAIT)
+        elif isinstance(action, game.actions.PickupAction):
+            self.record(Command.PICKUP, int(action.pick_all))
+        elif isinstance(action, game.actions.TakeStairsAction):
+            self.record(Command.STAIRS)
+        elif isinstance(action, game.actions.DropItem):
+            self.record(Command.DROP, items.index(action.item))
+        elif isinstance(action, game.actions.ItemAction):
+            self.record(Command.USE, items.index(action.item), *action.target_xy)
+        elif isinstance(action, game.actions.EquipAction):
+            self.record(Command.EQUIP, items.index(action.item))
+        else:
+            print(f"Stopped recording, {type(action).__name__} can not be recorded.")
+            self.close()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+recorder: Optional[Recorder] = None  # Set by main when recording.
+
+
+def record(command: Command, index: int = 0, x: int = 0, y: int = 0) -> None:
+    """Record a command which is not an Action, if recording."""
+    if recorder is not None:
+        recorder.record(command, index, x, y)
+
+
+def record_action(engine: game.engine.Engine, action: game.actions.Action) -> None:
+    """Record an action performed by the player, if recording."""
+    if recorder is not None:
+        recorder.record_action(engine, action)
+
+
+def read(file: BinaryIO) -> Tuple[int, List[Tuple[Command, int, int, int]]]:
+    """Return the seed and the commands of a recording."""
+    magic, version, seed = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a recording.")
+    if version > VERSION:
+        raise ValueError(f"Recording version {version} is newer than this game supports.")
+    data = file.read()
+    data = data[: len(data) - len(data) % RECORD.size]  # Ignore a record cut off by a crash.
+    commands = [(Command(command), index, x, y) for command, index, x, y in RECORD.iter_unpack(data)]
+    return seed, commands
+
+
+def apply(engine: game.engine.Engine, command: Command, index: int, x: int, y: int) -> None:
+    """Perform a recorded command the same way the input handlers do."""
+    player = engine.player
+    handler = game.input_handlers.EventHandler(engine)
+    if command == Command.BUMP:
+        handler.handle_action(game.actions.Bump(100, 100, player, x, y))
+    elif command == Command.WAIT:
+        handler.handle_action(game.actions.WaitAction(player))
+    elif command == Command.PICKUP:
+        handler.handle_action(game.actions.PickupAction(player, pick_all=bool(index)))
+    elif command == Command.STAIRS:
+        handler.handle_action(game.actions.TakeStairsAction(player))
+    elif command == Command.USE:
+        handler.handle_action(game.actions.ItemAction(player, player.inventory.items[index], (x, y)))
+    elif command == Command.DROP:
+        handler.handle_action(game.actions.DropItem(player, player.inventory.items[index]))
+    elif command == Command.EQUIP:
+        handler.handle_action(game.actions.EquipAction(100, player, player.inventory.items[index]))
+    elif command == Command.REST:
+        game.input_handlers.WaitHealEventHandler(engine).wait_to_heal()
+    elif command == Command.EXPLORE:
+        game.input_handlers.TravelEventHandler(engine).travel()
+    elif command == Command.TRAVEL:
+        game.input_handlers.TravelEventHandler(engine).travel((x, y))
+    elif command == Command.ATTACH:
+        item = player.inventory.items[index]
+        player.attachments.attach(item, x)
+        player.inventory.remove(item)
+    elif command == Command.DETACH:
+        player.inventory.add(player.attachments.detach(x))
+
+
+def state_digest(engine: game.engine.Engine) -> str:
+    """Return a short hash of the game state, replays of one recording should always agree on it."""
+    actors = sorted((actor.name, actor.x, actor.y, actor.fighter.hp) for actor in engine.game_map.actors)
+    state = (engine.game_world.current_floor, engine.player.x, engine.player.y, engine.player.fighter.hp, actors)
+    return hashlib.sha1(repr(state).encode()).hexdigest()[:12]
+
+
+def replay(filename: str) -> Iterator[Tuple[Command, float]]:
+    """Replay a recording and yield each command with the seconds it took."""
+    import game.setup_game
+
+    with open(filename, "rb") as f:
+        seed, commands = read(f)
+    engine = game.setup_game.new_game(floor_directory=tempfile.mkdtemp(), seed=seed)
+    try:
+        for command, index, x, y in commands:
+            if not engine.player.is_alive:
+                break
+            start = time.perf_counter()
+            apply(engine, command, index, x, y)
+            yield command, time.perf_counter() - start
+    finally:
+        print(f"Final state: {state_digest(engine)}")
+        engine.game_world.floor_store.clear()
+
+
+def report(filename: str) -> str:
+    """Replay a recording and return its total and per command timings."""
+    start = time.perf_counter()
+    timings = list(replay(filename))
+    total = time.perf_counter() - start
+    if not timings:
+        return "The recording has no commands."
+    samples = sorted(seconds for _, seconds in timings)
+
+    def percentile(p: float) -> float:
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000
+
+    lines = [
+        f"{len(timings)} commands in {total * 1000:.1f} ms, including starting the game.",
+        f"Per command: mean {sum(samples) / len(samples) * 1000:.2f} ms, p50 {percentile(50):.2f} ms,"
+        f" p90 {percentile(90):.2f} ms, p99 {percentile(99):.2f} ms, max {samples[-1] * 1000:.2f} ms.",
+    ]
+    for command in Command:
+        times = [seconds for kind, seconds in timings if kind == command]
+        if times:
+            lines.append(f"  {command.name:<8} x{len(times):<5} mean {sum(times) / len(times) * 1000:7.2f} ms")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded session without a window and time it.")
+    parser.add_argument("recording")
+    print(report(parser.parse_args().recording))
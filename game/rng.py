@@ -0,0 +1,52 @@
+"""Named random number streams, so that each subsystem's randomness is independent.
+
+Every stream is seeded from the game's root seed and its name, drawing from one
+stream never changes what another one produces.  Streams can be split by a
+key, such as a floor number, into a new independent set.  Splitting does not
+advance the parent, so a split can be made ahead of time and handed to a
+worker process and the results will be the same as doing the work in order.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict
+import hashlib
+import random
+
+STREAMS = (
+    "world",  # Map layout and monster placement.
+    "ai",  # Pathfinding tie breaking and confused movement.
+    "combat",
+    "loot",  # Item spawns.
+)
+
+
+def derive_seed(seed: int, *key: Any) -> int:
+    """Return a 64-bit seed which depends on `seed` and every part of `key`."""
+    digest = hashlib.sha256(repr((seed,) + key).encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+class RandomStreams:
+    """A set of named `random.Random` generators derived from one seed.
+
+    Streams are attributes, such as `engine.rng.world`.
+    """
+
+    world: random.Random
+    ai: random.Random
+    combat: random.Random
+    loot: random.Random
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.streams: Dict[str, random.Random] = {name: random.Random(derive_seed(seed, name)) for name in STREAMS}
+
+    def __getattr__(self, name: str) -> random.Random:
+        try:
+            return self.__dict__["streams"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def split(self, *key: Any) -> RandomStreams:
+        """Return new streams which depend only on this seed and `key`."""
+        return RandomStreams(derive_seed(self.seed, "split", *key))
@@ -0,0 +1,407 @@
+"""Versioned binary save format.
+
+A save file is laid out as:
+
+    header   MAGIC and format VERSION.
+    objects  An xz compressed pickle stream of the object graph.
+    arrays   64 byte aligned NumPy array data referenced by the pickle stream,
+             each one zlib compressed or raw.
+    index    A Python literal describing where every section lives.
+    trailer  The offset and length of the index.
+
+NumPy arrays, such as the chunks of the `GameMap.tiles`, `visible` and
+`explored` layers, are pulled out of the pickle stream into their own
+sections.  They are zlib compressed by default, tiles and bool arrays are
+mostly runs of the same value and shrink several times over, and are
+decompressed in pieces straight into their final buffers, so loading never
+holds a second copy of an array.  Sections written raw
+(`compress_arrays=False`) can instead be memory-mapped by `load`.
+
+Entities are not written as compact records keyed by content ID.  They are
+still part of the pickled object graph like everything else, so the object
+stream, and the time to save and load it, grows with the number of entities
+and their components.  Only callables owned by the content factories (the
+stat lambdas inside attachment Effects) are replaced by content IDs, which
+avoids dill for everything except unknown closures.
+"""
+from __future__ import annotations
+
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+import ast
+import importlib
+import io
+import lzma
+import os
+import pickle
+import struct
+import time
+import types
+import zlib
+
+import numpy as np
+
+MAGIC = b"CYBRSAV\0"
+VERSION = 2  # 2 added compressed array sections.
+
+HEADER = struct.Struct("<8sII")  # Magic, format version, reserved.
+TRAILER = struct.Struct("<QQ")  # Index offset, index length.
+ALIGNMENT = 64
+CHUNK_SIZE = 1 << 16
+PRESET = 1  # A small dictionary keeps the decompressor's memory low, object streams are small.
+ARRAY_LEVEL = 6  # zlib level for array sections.
+
+# Modules which own the prototypes and callables that saves refer to by ID.
+CONTENT_MODULES = (
+    "game.factories.entity_factories",
+    "game.factories.limb_factories",
+    "game.factories.unit_factories",
+)
+
+_content_ids: Optional[Dict[int, str]] = None
+_content_objects: Optional[Dict[str, Any]] = None
+
+
+class SaveFormatError(Exception):
+    """Raised when a file is not a save in a format this version can read."""
+
+
+def _load_content() -> None:
+    """Build the content ID tables from the factory modules."""
+    global _content_ids, _content_objects
+    import game.components.effect
+
+    ids: Dict[int, str] = {}
+    objects: Dict[str, Any] = {}
+    for module_name in CONTENT_MODULES:
+        module = importlib.import_module(module_name)
+        for name, value in vars(module).items():
+            if isinstance(value, game.components.effect.Effect):
+                value = value._effect
+            elif not (isinstance(value, types.FunctionType) and value.__name__ == "<lambda>"):
+                continue
+            content_id = f"{module_name}:{name}"
+            ids.setdefault(id(value), content_id)
+            objects[content_id] = value
+    _content_ids, _content_objects = ids, objects
+
+
+def content_id(obj: Any) -> Optional[str]:
+    """Return the content ID of a factory owned callable, or None."""
+    if _content_ids is None:
+        _load_content()
+    assert _content_ids is not None
+    return _content_ids.get(id(obj))
+
+
+def content_object(content_id: str) -> Any:
+    """Return the factory owned object for a content ID."""
+    if _content_objects is None:
+        _load_content()
+    assert _content_objects is not None
+    try:
+        return _content_objects[content_id]
+    except KeyError:
+        raise SaveFormatError(f"Unknown content ID {content_id!r}.") from None
+
+
+def _align(offset: int) -> int:
+    return -offset % ALIGNMENT
+
+
+class _Pickler(pickle.Pickler):
+    """Pickler which moves arrays and content callables out of the stream."""
+
+    def __init__(self, file: BinaryIO, external: Dict[int, str]):
+        super().__init__(file, protocol=5)
+        self.arrays: List[np.ndarray] = []
+        self.array_ids: Dict[int, int] = {}
+        self.external = external
+
+    def persistent_id(self, obj: Any) -> Optional[Tuple[Any, ...]]:
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+            if id(obj) not in self.array_ids:
+                self.array_ids[id(obj)] = len(self.arrays)
+                self.arrays.append(obj.copy(order="K"))  # Detach from the live game state.
+            return ("array", self.array_ids[id(obj)])
+        if isinstance(obj, types.FunctionType):
+            found = content_id(obj)
+            if found is not None:
+                return ("content", found)
+            if "<" in obj.__qualname__:  # Lambdas and closures can not be pickled by name.
+                import dill  # Slow to import and rarely needed.
+
+                return ("dill", dill.dumps(obj))
+            return None
+        key = self.external.get(id(obj))
+        if key is not None:
+            return ("external", key)
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file: BinaryIO, arrays: List[np.ndarray], external: Dict[str, Any]):
+        super().__init__(file)
+        self.arrays = arrays
+        self.external = external
+
+    def persistent_load(self, pid: Tuple[Any, ...]) -> Any:
+        kind, value = pid
+        if kind == "array":
+            return self.arrays[value]
+        if kind == "content":
+            return content_object(value)
+        if kind == "dill":
+            import dill
+
+            return dill.loads(value)
+        if kind == "external":
+            return self.external[value]
+        raise pickle.UnpicklingError(f"Unknown persistent ID {kind!r}.")
+
+
+class _SectionReader(io.RawIOBase):
+    """Read-only view of `length` bytes of a file starting at its current position."""
+
+    def __init__(self, file: BinaryIO, length: int):
+        self.file = file
+        self.remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        view = memoryview(buffer)[: self.remaining]
+        count = self.file.readinto(view)
+        self.remaining -= count
+        return count
+
+
+class Snapshot:
+    """A detached copy of an object graph which can be written out later, from any thread."""
+
+    def __init__(self, objects: bytes, arrays: List[np.ndarray]):
+        self.objects = objects  # Uncompressed pickle stream.
+        self.arrays = arrays
+
+
+def snapshot(obj: Any, external: Optional[Dict[str, Any]] = None) -> Snapshot:
+    """Return a Snapshot of `obj`, this is the only part of saving which must see live state.
+
+    `external` maps keys to objects which should be stored only as a
+    reference, such as an owning Engine, and must be provided again to `load`.
+    """
+    external_ids = {id(value): key for key, value in (external or {}).items()}
+    buffer = io.BytesIO()
+    pickler = _Pickler(buffer, external_ids)
+    pickler.dump(obj)
+    return Snapshot(buffer.getvalue(), pickler.arrays)
+
+
+def write(snapshot: Snapshot, file: BinaryIO, compress_arrays: bool = True) -> None:
+    """Compress and write `snapshot` to the start of the open binary `file`.
+
+    Array sections are stored raw if `compress_arrays` is False, so that they can be memory-mapped.
+    """
+    file.write(HEADER.pack(MAGIC, VERSION, 0))
+
+    objects_offset = file.tell()
+    compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=PRESET)
+    objects = memoryview(snapshot.objects)
+    for i in range(0, len(objects), CHUNK_SIZE):
+        file.write(compressor.compress(objects[i : i + CHUNK_SIZE]))
+    file.write(compressor.flush())
+    objects_length = file.tell() - objects_offset
+
+    arrays = []
+    for array in snapshot.arrays:
+        file.write(b"\0" * _align(file.tell()))
+        if array.flags.f_contiguous and not array.flags.c_contiguous:
+            order, data = "F", array.T
+        else:
+            order, data = "C", np.ascontiguousarray(array)
+        offset = file.tell()
+        raw = data.reshape(-1).view(np.uint8)
+        if compress_arrays:
+            compressor = zlib.compressobj(ARRAY_LEVEL)
+            for i in range(0, len(raw), CHUNK_SIZE):
+                file.write(compressor.compress(raw[i : i + CHUNK_SIZE]))
+            file.write(compressor.flush())
+        else:
+            file.write(raw)
+        arrays.append(
+            {
+                "offset": offset,
+                "length": file.tell() - offset,
+                "codec": "zlib" if compress_arrays else "raw",
+                "descr": np.lib.format.dtype_to_descr(array.dtype),
+                "shape": array.shape,
+                "order": order,
+            }
+        )
+
+    index = repr({"objects": (objects_offset, objects_length), "arrays": arrays}).encode("ascii")
+    index_offset = file.tell()
+    file.write(index)
+    file.write(TRAILER.pack(index_offset, len(index)))
+
+
+def write_atomic(snapshot: Snapshot, filename: str) -> None:
+    """Write `snapshot` to `filename` so that the file is never left partially written.
+
+    The data goes to a temporary file next to `filename` which then replaces it.
+    """
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "wb") as f:
+        write(snapshot, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+
+def dump(obj: Any, file: BinaryIO, external: Optional[Dict[str, Any]] = None) -> None:
+    """Write `obj` to the start of the open binary `file` in the current save format."""
+    write(snapshot(obj, external), file)
+
+
+def _read_index(file: BinaryIO) -> Dict[str, Any]:
+    file.seek(0)
+    magic, version, _ = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise SaveFormatError("Not a save file.")
+    if version > VERSION:
+        raise SaveFormatError(f"Save format version {version} is newer than this game supports.")
+    file.seek(-TRAILER.size, io.SEEK_END)
+    index_offset, index_length = TRAILER.unpack(file.read(TRAILER.size))
+    file.seek(index_offset)
+    index: Dict[str, Any] = ast.literal_eval(file.read(index_length).decode("ascii"))
+    return index
+
+
+def _inflate_into(file: BinaryIO, length: int, buffer: np.ndarray) -> None:
+    """Decompress `length` bytes of zlib data from `file` into `buffer`, a piece at a time."""
+    decompressor = zlib.decompressobj()
+    position = 0
+    while length > 0:
+        data = file.read(min(length, CHUNK_SIZE))
+        if not data:
+            raise SaveFormatError("Array section is truncated.")
+        length -= len(data)
+        while data and not decompressor.eof:
+            # Asking for one byte past a full buffer finds out if the section is too long.
+            out = decompressor.decompress(data, max(1, len(buffer) - position))
+            if position + len(out) > len(buffer):
+                raise SaveFormatError("Array section has the wrong size.")
+            buffer[position : position + len(out)] = np.frombuffer(out, np.uint8)
+            position += len(out)
+            data = decompressor.unconsumed_tail
+    if position != len(buffer) or not decompressor.eof:
+        raise SaveFormatError("Array section has the wrong size.")
+
+
+def load(file: BinaryIO, external: Optional[Dict[str, Any]] = None, mmap_mode: Optional[str] = None) -> Any:
+    """Load and return the object graph saved in `file`.
+
+    Arrays are read directly into their final buffers.  If `mmap_mode` is
+    given then raw array sections are memory-mapped from the file instead, see
+    `numpy.memmap`, compressed sections are always read.
+    """
+    index = _read_index(file)
+
+    arrays: List[np.ndarray] = []
+    for entry in index["arrays"]:
+        dtype = np.lib.format.descr_to_dtype(entry["descr"])
+        shape = entry["shape"]
+        order = entry["order"]
+        codec = entry.get("codec", "raw")  # Version 1 only wrote raw sections.
+        if mmap_mode and codec == "raw":
+            array = np.memmap(file.name, dtype=dtype, mode=mmap_mode, offset=entry["offset"], shape=shape, order=order)
+        else:
+            array = np.empty(shape, dtype=dtype, order=order)
+            buffer = (array.T if order == "F" else array).reshape(-1).view(np.uint8)
+            file.seek(entry["offset"])
+            if codec == "raw":
+                file.readinto(buffer)
+            elif codec == "zlib":
+                _inflate_into(file, entry["length"], buffer)
+            else:
+                raise SaveFormatError(f"Unknown array codec {codec!r}.")
+        arrays.append(array)
+
+    objects_offset, objects_length = index["objects"]
+    file.seek(objects_offset)
+    with lzma.LZMAFile(_SectionReader(file, objects_length)) as stream:
+        return _Unpickler(stream, arrays, external or {}).load()  # type: ignore[arg-type]
+
+
+def is_save_file(file: BinaryIO) -> bool:
+    """Return True if `file` starts with the save format header."""
+    file.seek(0)
+    is_save = file.read(len(MAGIC)) == MAGIC
+    file.seek(0)
+    return is_save
+
+
+def load_legacy(file: BinaryIO) -> Any:
+    """Load a save written before the versioned format, a dill pickle compressed with lzma."""
+    import dill
+
+    return dill.loads(lzma.decompress(file.read()))
+
+
+def benchmark(filename: str = "benchmark.sav", floors: int = 5, repeat: int = 3) -> None:
+    """Compare this format against the legacy dill and lzma path on a generated game."""
+    import tempfile
+    import tracemalloc
+
+    import dill
+
+    import game.setup_game
+
+    floor_directory = tempfile.mkdtemp()
+    engine = game.setup_game.new_game(floor_directory=floor_directory)
+    # Fill the world by descending, so the benchmark has a populated floor.
+    for _ in range(floors - 1):
+        engine.game_world.generate_floor()
+    engine.update_fov()
+
+    def save_legacy() -> None:
+        with open(filename, "wb") as f:
+            f.write(lzma.compress(dill.dumps(engine)))
+
+    def read_legacy() -> None:
+        with open(filename, "rb") as f:
+            load_legacy(f)
+
+    def save_current() -> None:
+        with open(filename, "wb") as f:
+            dump(engine, f)
+
+    def read_current() -> None:
+        with open(filename, "rb") as f:
+            load(f)
+
+    for name, save, read in (("legacy", save_legacy, read_legacy), ("current", save_current, read_current)):
+        save_times, load_times, peak = [], [], 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            save()
+            save_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            read()
+            load_times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        read()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(
+            f"{name:>8}: save {min(save_times) * 1000:7.2f} ms, load {min(load_times) * 1000:7.2f} ms,"
+            f" size {os.path.getsize(filename) / 1024:8.1f} KiB, load peak {peak / 1024:8.1f} KiB"
+        )
+    os.remove(filename)
+    engine.game_world.floor_store.clear()
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,40 +1,102 @@
 """Handle the loading and initialization of game sessions."""
 from __future__ import annotations
 
-from typing import Optional
+from typing import Any, Optional, Tuple
 import copy
-import lzma
-import dill as pickle
+import functools
+import hashlib
+import os
+import random
 import traceback
 
-from PIL import Image  # type: ignore
+from numpy.typing import NDArray
+import numpy as np
 import tcod
 from tcod import libtcodpy
 
 import game.input_handlers
 import game.color
 import game.engine
-import game.factories.unit_factories
+import game.floor_store
 import game.game_map
 import game.input_handlers
-import game.procgen
+import game.replay
+import game.rng
+import game.save_format
 
-# Load the background image.  Pillow returns an object convertable into a NumPy array.
-background_image = Image.open("data/menu.jpg")
+BACKGROUND_IMAGE = "data/menu.jpg"
+CACHE_DIRECTORY = "cache"
 
+MAP_SIZE = (65, 40)  # The width and height of a floor in a normal game.
 
-def new_game() -> game.engine.Engine:
-    """Return a brand new game session as an Engine instance."""
-    map_width = 65
-    map_height = 40
+
+@functools.lru_cache(maxsize=None)
+def get_background_image() -> Any:
+    """Load the background image the first time it is needed.
+
+    Pillow returns an object convertable into a NumPy array.
+    """
+    from PIL import Image  # type: ignore
+
+    return Image.open(BACKGROUND_IMAGE)
+
+
+def render_background(width: int, height: int) -> NDArray[Any]:
+    """Return the background image as `Console.rgb` data of the given size.
+
+    Converting the image is slow, so the result is cached on disk keyed by the
+    image contents and size.
+    """
+    with open(BACKGROUND_IMAGE, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    cache_path = os.path.join(CACHE_DIRECTORY, f"menu_{digest}_{width}x{height}.npy")
+    try:
+        rgb: NDArray[Any] = np.load(cache_path)
+        return rgb
+    except (OSError, ValueError):
+        pass
+
+    console = tcod.console.Console(width, height, order="F")
+    console.draw_semigraphics(get_background_image(), 0, 0)
+    try:
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        np.save(cache_path, console.rgb)
+    except OSError:
+        pass  # Not being able to cache only costs time.
+    return console.rgb
+
+
+def new_game(
+    floor_directory: str = "savegame.floors", seed: Optional[int] = None, map_size: Tuple[int, int] = MAP_SIZE
+) -> game.engine.Engine:
+    """Return a brand new game session as an Engine instance.
+
+    Floors already in `floor_directory` are left alone, they belong to the
+    existing save until this game is saved over it.  The same `seed` always
+    gives the same game, a random seed is used if it is None.
+
+    Floors are `map_size` tiles with as many rooms per area as a normal game.
+    Only `game.diagnostics` asks for other sizes, recordings and the main
+    menu always use MAP_SIZE.
+    """
+    # Content is imported here so that it is not needed to show the main menu.
+    import game.factories.entity_factories
+    import game.factories.unit_factories
+
+    map_width, map_height = map_size
 
     room_max_size = 8
     room_min_size = 6
-    max_rooms = 30
+    max_rooms = 30 * map_width * map_height // (MAP_SIZE[0] * MAP_SIZE[1])
+
+    if seed is None:
+        seed = random.getrandbits(63)
+    if game.replay.recorder is not None:
+        game.replay.recorder.start(seed)
 
     player = copy.deepcopy(game.factories.unit_factories.player)
 
-    engine = game.engine.Engine(player=player)
+    engine = game.engine.Engine(player=player, seed=seed)
 
     engine.game_world = game.game_map.GameWorld(
         engine=engine,
@@ -43,6 +105,7 @@ def new_game() -> game.engine.Engine:
         room_max_size=room_max_size,
         map_width=map_width,
         map_height=map_height,
+        floor_directory=floor_directory,
     )
 
     engine.game_world.generate_floor()
@@ -53,13 +116,10 @@ def new_game() -> game.engine.Engine:
     dagger = copy.deepcopy(game.factories.entity_factories.dagger)
     leather_armor = copy.deepcopy(game.factories.entity_factories.leather_armor)
 
-    dagger.parent = player.inventory
-    leather_armor.parent = player.inventory
-
-    player.inventory.items.append(dagger)
+    player.inventory.add(dagger)
     player.equipment.toggle_equip(dagger, add_message=False)
 
-    player.inventory.items.append(leather_armor)
+    player.inventory.add(leather_armor)
     player.equipment.toggle_equip(leather_armor, add_message=False)
 
     return engine
@@ -68,16 +128,40 @@ def new_game() -> game.engine.Engine:
 def load_game(filename: str) -> game.engine.Engine:
     """Load an Engine instance from a file."""
     with open(filename, "rb") as f:
-        engine = pickle.loads(lzma.decompress(f.read()))
+        if game.save_format.is_save_file(f):
+            engine = game.save_format.load(f)
+        else:  # Saves from before the versioned format.
+            engine = game.save_format.load_legacy(f)
     assert isinstance(engine, game.engine.Engine)
+    if not hasattr(engine, "rng"):  # Saves from before the engine owned its random streams.
+        engine.rng = game.rng.RandomStreams(random.getrandbits(63))
+    world = engine.game_world
+    if not hasattr(world, "floors"):  # Saves from before the floor store, only the current floor was kept.
+        world.floors = {world.current_floor: engine.game_map}
+        world.floor_store = game.floor_store.FloorStore(game.floor_store.directory_for(filename))
+        world.resident_radius = 1
     return engine
 
 
 class MainMenu(game.input_handlers.BaseEventHandler):
     """Handle the main menu rendering and input."""
+
+    def __init__(self) -> None:
+        self.menu_console: Optional[tcod.console.Console] = None  # The static menu, drawn once.
+
     def on_render(self, console: tcod.console.Console) -> None:
         """Render the main menu on a background image."""
-        console.draw_semigraphics(background_image, 0, 0)
+        if self.menu_console is None or (self.menu_console.width, self.menu_console.height) != (
+            console.width,
+            console.height,
+        ):
+            self.menu_console = self.render_menu(console.width, console.height)
+        self.menu_console.blit(console)
+
+    def render_menu(self, width: int, height: int) -> tcod.console.Console:
+        """Return a new console with the background and menu text drawn on it."""
+        console = tcod.console.Console(width, height, order="F")
+        console.rgb[:] = render_background(width, height)
 
         console.print(
             console.width // 2,
@@ -105,6 +189,7 @@ class MainMenu(game.input_handlers.BaseEventHandler):
                 alignment=libtcodpy.CENTER,
                 bg_blend=libtcodpy.BKGND_ALPHA(64),
             )
+        return console
 
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[game.input_handlers.BaseEventHandler]:
         if event.sym in (tcod.event.KeySym.q, tcod.event.KeySym.ESCAPE):
@@ -1,5 +1,39 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    import game.audio
+
+
 class Sound:
-    def __init__(self, soundName: str, soundFile: str, soundVolume: float) -> None:
+    def __init__(self, soundName: str, soundFile: str, soundVolume: float, priority: int = 0) -> None:
         self.name = soundName
         self.file = soundFile
-        self.volume = soundVolume
\ No newline at end of file
+        self.volume = soundVolume
+        self.priority = priority  # Higher priority sounds can steal voices from lower ones.
+
+
+SOUNDS: Dict[str, Sound] = {
+    sound.name: sound
+    for sound in [
+        Sound("death", "data/death.wav", 1.0, priority=2),
+        Sound("orc_die", "data/orc.wav", 1.0, priority=1),
+        Sound("sword_slash", "data/sword_slash.wav", 1.0),
+    ]
+}
+"""Every sound the game can play, keyed by name."""
+
+audio: Optional[game.audio.Audio] = None  # Set by main when an audio device is open.
+
+
+def queue_sfx(soundName: str) -> None:
+    """Queue a sound effect for the end of the turn, does nothing without audio."""
+    if audio is not None:
+        audio.queue_sfx(soundName)
+
+
+def flush_sfx() -> None:
+    """Play the sound effects queued during this turn."""
+    if audio is not None:
+        audio.flush_sfx()
@@ -0,0 +1,90 @@
+"""Startup timing, and background loading of what the main menu does not need.
+
+Run `python -m game.startup` for a per-module import time report.
+"""
+from __future__ import annotations
+
+from typing import Iterable, List, Tuple
+import importlib
+import sys
+import threading
+import time
+import traceback
+
+TARGET_FIRST_FRAME_MS = 300.0  # Time from launch until the main menu is presented.
+
+# Modules needed before the first frame, in the order main imports them.
+MENU_MODULES = (
+    "tcod",
+    "game.color",
+    "game.exceptions",
+    "game.engine",
+    "game.input_handlers",
+    "game.setup_game",
+    "PIL.Image",  # Only needed when the menu background cache is cold.
+)
+
+# Modules only needed once a game is started or loaded.
+DEFERRED_MODULES = (
+    "game.procgen",
+    "game.factories.entity_factories",
+    "game.factories.limb_factories",
+    "game.factories.unit_factories",
+    "dill",
+)
+
+
+def preload_in_background(modules: Iterable[str] = DEFERRED_MODULES) -> threading.Thread:
+    """Import `modules` on a daemon thread and return the thread.
+
+    Starting a game before this finishes is safe, the import system will wait on
+    any module which is still loading.
+    """
+
+    def preload() -> None:
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                traceback.print_exc()
+
+    thread = threading.Thread(target=preload, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def time_imports(modules: Iterable[str]) -> List[Tuple[str, float]]:
+    """Import `modules` in order and return how many milliseconds each one took.
+
+    A module's time includes any of its dependencies which were not already
+    imported, so this should be run in a fresh interpreter.
+    """
+    times = []
+    for name in modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        times.append((name, (time.perf_counter() - start) * 1000))
+    return times
+
+
+def first_frame_report(start_time: float) -> str:
+    """Return the time to first frame since `start_time`, compared against the target."""
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    verdict = "ok" if elapsed_ms <= TARGET_FIRST_FRAME_MS else "over target"
+    return f"Time to first frame: {elapsed_ms:.1f} ms (target {TARGET_FIRST_FRAME_MS:.0f} ms, {verdict})."
+
+
+def import_report() -> str:
+    """Return a report of the import time of every menu and deferred module."""
+    lines = []
+    for title, modules in (("Before first frame", MENU_MODULES), ("Deferred", DEFERRED_MODULES)):
+        times = time_imports(modules)
+        lines.append(f"{title}: {sum(ms for _, ms in times):.1f} ms")
+        lines.extend(f"  {ms:8.1f} ms  {name}" for name, ms in times)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if any(name in sys.modules for name in MENU_MODULES[1:]):
+        print("Warning: some modules were already imported, their times will be too low.")
+    print(import_report())
@@ -55,3 +55,15 @@ down_stairs = new_tile(
     dark=(ord("<"), (255, 255, 255), (29, 15, 29)),
     light=(ord("<"), (255, 255, 255), (60, 55, 72)),
 )
+
+# Every tile type, maps store the index of each of their tiles in this array.
+tile_types = np.stack([wall, floor, down_stairs])
+WALL, FLOOR, DOWN_STAIRS = range(len(tile_types))
+
+
+def tile_ids(tiles: NDArray[Any]) -> NDArray[np.uint8]:
+    """Return the index into `tile_types` of each tile of an array of `tile_dt`, unknown tiles become walls."""
+    ids = np.full(tiles.shape, WALL, dtype=np.uint8)
+    for tile_id, tile_type in enumerate(tile_types):
+        ids[tiles == tile_type] = tile_id
+    return ids
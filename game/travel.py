@@ -0,0 +1,260 @@
+"""Auto-explore and travel, driven by cached distance maps.
+
+Distance maps only cover a box around the explored tiles of a floor, every
+tile outside of it is unexplored and can't be walked through, so the cost of
+building them depends on how much has been explored instead of the map size.
+
+Since `explored` only ever grows, a map to a fixed goal (the stairs, a clicked
+tile) stays valid as more of the floor is seen, new tiles can only make paths
+shorter, so it is updated in place instead of being rebuilt.  The frontier
+map's goals change as the floor is explored, so it is rebuilt, but only on
+turns which revealed new tiles.  While travelling only the FOV window is
+checked for newly explored tiles.
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+import weakref
+
+import numpy as np
+import tcod
+
+if TYPE_CHECKING:
+    import game.actions
+
+import game.engine
+import game.entity
+import game.exceptions
+import game.game_map
+import game.tiles
+
+MAX_TRAVEL_TURNS = 1000  # Stop a runaway travel, such as a path blocked by an unseen actor.
+BOX_MARGIN = 32  # Tiles added around the explored box when it grows, so that it grows rarely.
+
+Window = Tuple[slice, slice]
+
+_maps: weakref.WeakKeyDictionary[game.game_map.GameMap, TravelMaps] = weakref.WeakKeyDictionary()
+
+
+class TravelMaps:
+    """Distance maps over the explored part of one GameMap.
+
+    Arrays are indexed relative to `left` and `top`, the corner of the box
+    around the explored tiles.  Only the map to the downstairs and the map to
+    the most recent other goal are kept.
+    """
+
+    def __init__(self, game_map: game.game_map.GameMap):
+        self.game_map = game_map
+        self.left = self.top = 0
+        self.explored = np.zeros((0, 0), dtype=bool)  # Copy of the explored tiles in the box.
+        self.cost = np.zeros((0, 0), dtype=np.int8)
+        self.version = 0  # Increased whenever `explored` changes.
+        self.frontier: Optional[np.ndarray] = None
+        self.goals: Dict[Tuple[int, int], np.ndarray] = {}
+        self.goal_versions: Dict[Tuple[int, int], int] = {}
+
+    @property
+    def box(self) -> Window:
+        """The box covered by these maps, in map coordinates."""
+        width, height = self.explored.shape
+        return slice(self.left, self.left + width), slice(self.top, self.top + height)
+
+    def _grow(self, left: int, top: int, right: int, bottom: int) -> None:
+        """Grow the box to include the tiles from `left`, `top` up to `right`, `bottom`."""
+        width, height = self.explored.shape
+        if width and left >= self.left and top >= self.top and right <= self.left + width and bottom <= self.top + height:
+            return
+        if width:
+            left, top = min(left, self.left), min(top, self.top)
+            right, bottom = max(right, self.left + width), max(bottom, self.top + height)
+        left, top = max(0, left - BOX_MARGIN), max(0, top - BOX_MARGIN)
+        right = min(self.game_map.width, right + BOX_MARGIN)
+        bottom = min(self.game_map.height, bottom + BOX_MARGIN)
+        old = self.box
+        self.explored, explored = np.zeros((right - left, bottom - top), dtype=bool), self.explored
+        self.cost, cost = np.zeros(self.explored.shape, dtype=np.int8), self.cost
+        self.left, self.top = left, top
+        local = self.local(old)
+        self.explored[local] = explored
+        self.cost[local] = cost
+        self.frontier = None
+        self.goals.clear()  # Their shape no longer matches.
+        self.goal_versions.clear()
+
+    def local(self, window: Window) -> Window:
+        """Convert a window in map coordinates to one relative to the box."""
+        return (
+            slice(window[0].start - self.left, window[0].stop - self.left),
+            slice(window[1].start - self.top, window[1].stop - self.top),
+        )
+
+    def update(self, window: Optional[Window] = None) -> bool:
+        """Copy newly explored tiles from `window`, or the whole map if None, return True if any were found.
+
+        Tiles can only be explored through the FOV, so after a turn only its window needs to be checked.
+        """
+        game_map = self.game_map
+        if window is None:
+            window = game_map.explored.extent()  # Only the chunks which have been explored.
+            if window is None:
+                return False
+        explored = game_map.explored[window]
+        xs = np.flatnonzero(explored.any(axis=1))
+        if not xs.size:
+            return False
+        ys = np.flatnonzero(explored.any(axis=0))
+        left, top = window[0].start, window[1].start
+        self._grow(left + int(xs[0]), top + int(ys[0]), left + int(xs[-1]) + 1, top + int(ys[-1]) + 1)
+
+        # Clip the window to the box, everything explored is inside of it.
+        box = self.box
+        window = (
+            slice(max(window[0].start, box[0].start), min(window[0].stop, box[0].stop)),
+            slice(max(window[1].start, box[1].start), min(window[1].stop, box[1].stop)),
+        )
+        explored = game_map.explored[window]
+        local = self.local(window)
+        if np.array_equal(self.explored[local], explored):
+            return False
+        self.explored[local] = explored
+        self.cost[local] = game.tiles.tile_types["walkable"][game_map.tiles[window]] & explored
+        self.version += 1
+        self.frontier = None
+        return True
+
+    def to_frontier(self) -> np.ndarray:
+        """Return the distance to the nearest explored tile next to an unexplored one."""
+        if self.frontier is None:
+            # Tiles outside of the box are unexplored, except past the map edges which are treated as explored.
+            padded = np.pad(~self.explored, 1, constant_values=True)
+            box = self.box
+            if box[0].start == 0:
+                padded[0, :] = False
+            if box[0].stop == self.game_map.width:
+                padded[-1, :] = False
+            if box[1].start == 0:
+                padded[:, 0] = False
+            if box[1].stop == self.game_map.height:
+                padded[:, -1] = False
+            # Any tile with an unexplored neighbour.
+            near_unexplored = np.zeros(self.explored.shape, dtype=bool)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    near_unexplored |= padded[1 + dx : padded.shape[0] - 1 + dx, 1 + dy : padded.shape[1] - 1 + dy]
+            self.frontier = tcod.path.maxarray(self.cost.shape, dtype=np.int32)
+            self.frontier[(self.cost > 0) & near_unexplored] = 0
+            tcod.path.dijkstra2d(self.frontier, self.cost, 2, 3, out=self.frontier)
+        return self.frontier
+
+    def to_goal(self, x: int, y: int) -> np.ndarray:
+        """Return the distance to the tile at `x`, `y`, which must be explored."""
+        goal = (x, y)
+        dist = self.goals.get(goal)
+        if dist is None:
+            # Keep the way to the stairs, other goals are replaced by the newest one.
+            for old_goal in [old_goal for old_goal in self.goals if old_goal != self.game_map.downstairs_location]:
+                del self.goals[old_goal]
+                del self.goal_versions[old_goal]
+            dist = self.goals[goal] = tcod.path.maxarray(self.cost.shape, dtype=np.int32)
+            dist[x - self.left, y - self.top] = 0
+        elif self.goal_versions[goal] == self.version:
+            return dist
+        # Existing distances are still upper bounds, so this only relaxes the newly explored tiles.
+        tcod.path.dijkstra2d(dist, self.cost, 2, 3, out=dist)
+        self.goal_versions[goal] = self.version
+        return dist
+
+
+def get_maps(game_map: game.game_map.GameMap) -> TravelMaps:
+    """Return the cached TravelMaps of `game_map`, these are not saved."""
+    maps = _maps.get(game_map)
+    if maps is None:
+        maps = _maps[game_map] = TravelMaps(game_map)
+    return maps
+
+
+def next_step(dist: np.ndarray, x: int, y: int) -> Optional[Tuple[int, int]]:
+    """Return the direction which goes downhill on `dist` from `x`, `y`, or None if already at the bottom."""
+    best = dist[x, y]
+    step = None
+    width, height = dist.shape
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            if 0 <= x + dx < width and 0 <= y + dy < height and dist[x + dx, y + dy] < best:
+                best = dist[x + dx, y + dy]
+                step = dx, dy
+    return step
+
+
+def _visible_enemies(engine: game.engine.Engine) -> bool:
+    game_map = engine.game_map
+    window_x, window_y = game_map.visible_window
+    actors = game_map.actors_in_mask(game_map.visible[game_map.visible_window], (window_x.start, window_y.start))
+    return any(actor is not engine.player for actor in actors)
+
+
+def _step_window(engine: game.engine.Engine) -> Tuple[slice, slice]:
+    """Return the window the player could see after taking one step."""
+    game_map = engine.game_map
+    reach = game.engine.FOV_RADIUS + 1
+    x, y = engine.player.x, engine.player.y
+    return (
+        slice(max(0, x - reach), min(game_map.width, x + reach + 1)),
+        slice(max(0, y - reach), min(game_map.height, y + reach + 1)),
+    )
+
+
+def _found_item(game_map: game.game_map.GameMap, window: Tuple[slice, slice], explored: np.ndarray) -> bool:
+    """Return True if an item is on a tile of `window` which is visible now and was not in `explored` before."""
+    xs, ys = np.nonzero(game_map.visible[window] & ~explored)
+    return any(
+        isinstance(entity, game.entity.Item)
+        for position in zip((xs + window[0].start).tolist(), (ys + window[1].start).tolist())
+        for entity in game_map.tile_entities.get(position, ())
+    )
+
+
+def travel(engine: game.engine.Engine, goal: Optional[Tuple[int, int]] = None) -> str:
+    """Walk the player towards `goal`, or towards unexplored tiles if `goal` is None.
+
+    Turns are taken back to back without rendering, each one the same as a
+    single step by the player.  Returns the reason travel stopped.
+    """
+    if _visible_enemies(engine):
+        return "Not with enemies in view."
+    player = engine.player
+    game_map = engine.game_map
+    maps = get_maps(game_map)
+    if goal is not None and not (game_map.in_bounds(*goal) and game_map.explored[goal]):
+        return "You don't know the way there."
+
+    maps.update()
+    for _ in range(MAX_TRAVEL_TURNS):
+        dist = maps.to_frontier() if goal is None else maps.to_goal(*goal)
+        step = next_step(dist, player.x - maps.left, player.y - maps.top)
+        if step is None:
+            if goal is None:
+                return "Nothing left to explore."
+            return "You arrive." if (player.x, player.y) == goal else "You can't find a way there."
+
+        hp = player.fighter.hp
+        window = _step_window(engine)
+        explored = game_map.explored[window]
+        try:
+            game.actions.Move(100, player, *step).perform()
+        except game.exceptions.Impossible as exc:
+            return str(exc.args[0])
+        engine.handle_enemy_turns()
+        engine.update_fov()
+        maps.update(game_map.visible_window)
+
+        if not player.is_alive:
+            return "You died."
+        if player.fighter.hp < hp:
+            return "You are hurt!"
+        if _visible_enemies(engine):
+            return "You see an enemy."
+        if _found_item(game_map, window, explored):
+            return "You find an item."
+    return "You stop to get your bearings."
@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
+import time
+
+START_TIME = time.perf_counter()  # Taken before the slow imports, for the time to first frame.
+
+import argparse
 import traceback
 
 import tcod
+import game.autosave
 import game.color
 import game.exceptions
+import game.frame_pacing
 import game.input_handlers
+import game.replay
 import game.setup_game
+import game.sound
+import game.startup
 
 
 def save_game(handler: game.input_handlers.BaseEventHandler, filename: str) -> None:
@@ -15,7 +25,22 @@ def save_game(handler: game.input_handlers.BaseEventHandler, filename: str) -> N
         print("Game saved.")
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="CYBERGORE")
+    parser.add_argument("--startup-report", action="store_true", help="print the time taken to show the first frame")
+    parser.add_argument(
+        "--loop",
+        choices=["blocking", "paced"],
+        default="blocking",
+        help="handle every event before each frame, or coalesce events and handle them within a frame budget",
+    )
+    parser.add_argument("--metrics", action="store_true", help="print autosave stalls and input latency on exit")
+    parser.add_argument("--record", metavar="FILE", help="record the commands of new games, see game.replay")
+    return parser.parse_args()
+
+
 def main() -> None:
+    args = parse_args()
     screen_width = 80
     screen_height = 50
 
@@ -24,6 +49,17 @@ def main() -> None:
     )
 
     handler: game.input_handlers.BaseEventHandler = game.setup_game.MainMenu()
+    autosaver = game.autosave.Autosaver("savegame.sav", interval=game.autosave.AUTOSAVE_INTERVAL)
+    pacer = game.frame_pacing.FramePacer(args.loop)
+    if args.record:
+        game.replay.recorder = game.replay.Recorder(args.record)
+    try:
+        import game.audio
+
+        game.sound.audio = game.audio.Audio()
+        game.sound.audio.load_sounds()
+    except Exception:
+        traceback.print_exc()  # Play without sound if there is no audio device.
 
     with tcod.context.new(
         columns=screen_width,
@@ -33,30 +69,50 @@ def main() -> None:
         vsync=True,
     ) as context:
         root_console = tcod.console.Console(screen_width, screen_height, order="F")
+        first_frame = True
         try:
             while True:
                 root_console.clear()
                 handler.on_render(console=root_console)
                 context.present(root_console)
+                pacer.presented()
+
+                if first_frame:
+                    first_frame = False
+                    if args.startup_report:
+                        print(game.startup.first_frame_report(START_TIME))
+                    game.startup.preload_in_background()
 
                 try:
-                    for event in tcod.event.wait():
-                        context.convert_event(event)
+                    for event in pacer.events(context):
                         handler = handler.handle_events(event)
                 except Exception:  # Handle exceptions in game.
                     traceback.print_exc()  # Print error to stderr.
                     # Then print the error to the message log.
                     if isinstance(handler, game.input_handlers.EventHandler):
                         handler.engine.message_log.add_message(traceback.format_exc(), game.color.error)
-                        
+
+                if isinstance(handler, game.input_handlers.EventHandler):
+                    autosaver.update(handler.engine)
+
         except game.exceptions.QuitWithoutSaving:
+            autosaver.close()
             raise
         except SystemExit:  # Save and quit.
+            autosaver.close()
             save_game(handler, "savegame.sav")
             raise
         except BaseException:  # Save on any other unexpected exception.
+            autosaver.close()
             save_game(handler, "savegame.sav")
             raise
+        finally:
+            if args.metrics:
+                print(autosaver.stall_report())
+            if args.metrics or args.loop == "paced":
+                print(pacer.latency_report())
+            if game.replay.recorder is not None:
+                game.replay.recorder.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,38 @@
+"""Fast-forwarding a rest must end in the same state as resting a turn at a time."""
+from __future__ import annotations
+
+from typing import List, Tuple
+import pathlib
+
+import pytest
+
+import game.engine
+import game.setup_game
+
+SEEDS = range(40)
+
+
+def rest_state(engine: game.engine.Engine) -> List[Tuple[str, int, int, int, bool]]:
+    """Return the name, position, cooldown and dormancy of each actor, sorted by position."""
+    game_map = engine.game_map
+    return sorted(
+        (actor.name, actor.x, actor.y, actor.cooldown, actor in game_map.dormant) for actor in game_map.actors
+    )
+
+
+@pytest.mark.parametrize("turns", [1, 7, 50, 300])
+def test_fast_forward_rest_matches_resting_each_turn(tmp_path: pathlib.Path, turns: int) -> None:
+    checked = 0
+    for seed in SEEDS:
+        slow = game.setup_game.new_game(floor_directory=str(tmp_path / f"slow_{seed}"), seed=seed)
+        if not slow.can_fast_forward():
+            continue
+        for _ in range(turns):
+            slow.rest_turn()
+
+        fast = game.setup_game.new_game(floor_directory=str(tmp_path / f"fast_{seed}"), seed=seed)
+        fast.fast_forward_rest(turns)
+
+        assert rest_state(fast) == rest_state(slow), f"seed {seed}"
+        checked += 1
+    assert checked, "No seed could be fast-forwarded."